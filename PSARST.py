@@ -1,39 +1,37 @@
-import yfinance as yf
-import pandas_ta as ta
+import argparse
 import numpy as np
 import datetime as dt
 import pandas as pd
-import mplfinance as mpf
-from matplotlib import style
-from mplfinance.original_flavor import candlestick_ohlc
-import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
-import math
-import warnings
-warnings.simplefilter(action='ignore', category=pd.errors.SettingWithCopyWarning)
+from psarst_cache import OHLCVCache
+from psarst_memo import ResultCache, fingerprint
+import psarst_kernels
+import psarst_profile
+from psarst_profile import stage
 
+# yfinance, pandas_ta, matplotlib and mplfinance are imported inside the functions that
+# use them, so importing this module stays cheap and has no side effects
 
 
-# Function to extract historical stock data from Yahoo Finance
-def extract_data(ticker, start_date, end_date):
+
+# Function to extract historical stock data from Yahoo Finance (through a local cache if given)
+@stage('extract_data')
+def extract_data(ticker, start_date, end_date, cache=None):
+    if cache is not None:
+        return cache.get(ticker, start_date, end_date)
+    import yfinance as yf
     data = yf.download(ticker, start=start_date, end=end_date)
     return data
 
-def calculate_sar(high, low, acceleration=0.02, max_acceleration=0.2):
-    """
-    Calculate Parabolic SAR for given high and low price series.
-    """
-    sar = []
+# Parabolic SAR state machine for one symbol, filling sar in place. Runs as plain Python on
+# lists, or compiled by numba on arrays (see psarst_kernels)
+def _sar_loop(high, low, acceleration, max_acceleration, sar):
     af = acceleration  # Initialize acceleration factor
     ep = low[0]  # Extreme point (start with the first low)
     is_long = True  # Assume an uptrend at the start
     prev_sar = low[0]  # Start SAR with the first low
+    sar[0] = prev_sar  # Initial SAR
 
-    for i in range(len(high)):
-        if i == 0:
-            sar.append(prev_sar)  # Initial SAR
-            continue
-
+    for i in range(1, len(high)):
         # Update SAR based on trend direction
         current_sar = prev_sar + af * (ep - prev_sar)
 
@@ -60,197 +58,574 @@ def calculate_sar(high, low, acceleration=0.02, max_acceleration=0.2):
                     af = min(af + acceleration, max_acceleration)  # Increase AF
 
         prev_sar = current_sar  # Update previous SAR
-        sar.append(current_sar)
+        sar[i] = current_sar
 
+# Parabolic SAR for a (bars x symbols) block, stepping all symbols together
+def _sar_block(high, low, acceleration, max_acceleration):
+    n_bars, n_symbols = high.shape
+    sar = np.empty((n_bars, n_symbols), dtype=np.float64)
+    af = np.full(n_symbols, acceleration, dtype=np.float64)
+    ep = low[0].copy()
+    is_long = np.ones(n_symbols, dtype=bool)
+    prev_sar = low[0].copy()
+    sar[0] = prev_sar
+
+    for i in range(1, n_bars):
+        bar_high = high[i]
+        bar_low = low[i]
+        current_sar = prev_sar + af * (ep - prev_sar)
+
+        # Reversals: long positions pierced by the low, short ones by the high
+        to_short = is_long & (current_sar > bar_low)
+        to_long = ~is_long & (current_sar < bar_high)
+        reverse = to_short | to_long
+
+        # New extreme points in the direction of the current trend
+        new_high = is_long & ~reverse & (bar_high > ep)
+        new_low = ~is_long & ~reverse & (bar_low < ep)
+
+        current_sar = np.where(reverse, ep, current_sar)
+        af = np.where(reverse, acceleration,
+                      np.where(new_high | new_low, np.minimum(af + acceleration, max_acceleration), af))
+        ep = np.where(to_short | new_high, bar_high, np.where(to_long | new_low, bar_low, ep))
+        is_long = is_long ^ reverse
+
+        sar[i] = current_sar
+        prev_sar = current_sar
+
+    return sar
+
+def sar_kernel(high, low, acceleration=0.02, max_acceleration=0.2):
+    """
+    Calculate Parabolic SAR on NumPy arrays.
+
+    high and low are 1-D (bars) or 2-D (bars x symbols) arrays. Every symbol
+    follows the same rules as calculate_sar and gives bit-identical values.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    if len(high) == 0:
+        return np.empty(high.shape, dtype=np.float64)
+
+    sar_loop = psarst_kernels.compiled(_sar_loop)
+    if sar_loop is not None:  # Compiled: one tight loop per symbol beats stepping the block
+        sar = np.empty(high.shape, dtype=np.float64)
+        if high.ndim == 1:
+            sar_loop(high, low, acceleration, max_acceleration, sar)
+        else:
+            for j in range(high.shape[1]):
+                sar_loop(np.ascontiguousarray(high[:, j]), np.ascontiguousarray(low[:, j]), acceleration,
+                         max_acceleration, sar[:, j])
+        return sar
+    if high.ndim == 1:
+        sar = [0.0] * len(high)
+        _sar_loop(high.tolist(), low.tolist(), acceleration, max_acceleration, sar)
+        return np.array(sar, dtype=np.float64)
+    return _sar_block(high, low, acceleration, max_acceleration)
+
+@stage('calculate_sar')
+def calculate_sar(high, low, acceleration=0.02, max_acceleration=0.2):
+    """
+    Calculate Parabolic SAR for given high and low price series.
+
+    Pass DataFrames with one column per symbol to compute a whole universe at once.
+    """
+    sar = sar_kernel(high.to_numpy(dtype=np.float64), low.to_numpy(dtype=np.float64),
+                     acceleration=acceleration, max_acceleration=max_acceleration)
+    if isinstance(high, pd.DataFrame):
+        return pd.DataFrame(sar, index=high.index, columns=high.columns)
     return pd.Series(sar, index=high.index)
 
 
 # Function to calculate various technical indicators
-def indicators(data):
-    # Calculate RSI (Relative Strength Index) with a 14-day period
-    data['RSI'] = ta.rsi(data['Adj Close'], length=14)
+@stage('indicators')
+def indicators(data, rsi_length=14, atr_length=14, st_length=10, st_multiplier=3,
+               acceleration=0.02, max_acceleration=0.2):
+    import pandas_ta as ta
+
+    # Calculate RSI (Relative Strength Index), 14-day period by default
+    data['RSI'] = ta.rsi(data['Adj Close'], length=rsi_length)
     
-    # Calculate ATR (Average True Range) with a 14-day period
-    data['ATR'] = ta.atr(data['High'], data['Low'], data['Adj Close'], length=14)
+    # Calculate ATR (Average True Range), 14-day period by default
+    data['ATR'] = ta.atr(data['High'], data['Low'], data['Adj Close'], length=atr_length)
     
-    # Calculate SuperTrend indicator with a 10-day period and multiplier of 3
-    st = ta.supertrend(data['High'], data['Low'], data['Adj Close'], length=10, multiplier=3)
+    # Calculate SuperTrend indicator, 10-day period and multiplier of 3 by default
+    st = ta.supertrend(data['High'], data['Low'], data['Adj Close'], length=st_length, multiplier=st_multiplier)
     data = pd.merge(data, st, left_index=True, right_index=True)
-    data.rename(columns={data.columns[8]: 'SuperTrend'}, inplace=True)
+    data.rename(columns={st.columns[0]: 'SuperTrend'}, inplace=True)
     
     # Set 'Close' column to adjusted close
     data['Close'] = data['Adj Close']
     
     # Keep only relevant columns: Open, High, Low, Close, Volume, RSI, ATR, SuperTrend
-    data = data[['Open', 'High', 'Low', 'Close', 'Volume', 'RSI', 'ATR', 'SuperTrend']]
+    data = data[['Open', 'High', 'Low', 'Close', 'Volume', 'RSI', 'ATR', 'SuperTrend']].copy()
     
     # Calculate Parabolic SAR (Stop and Reverse)
-    data['SAR'] = calculate_sar(data['High'], data['Low'], acceleration=0.02, max_acceleration=0.2)
+    data['SAR'] = calculate_sar(data['High'], data['Low'], acceleration=acceleration, max_acceleration=max_acceleration)
     
     # Drop any rows with missing values
     data.dropna(inplace=True)
     
     return data
 
+# Categories of the 'Trend' column; the stored code is 0 for Downtrend and 1 for Uptrend
+TREND_LABELS = ['Downtrend', 'Uptrend']
+
+def trend_flags(close, supertrend):
+    """
+    Return a boolean array that is True where Close is above the previous bar's SuperTrend.
+
+    The first bar has no previous SuperTrend and is always flagged as a downtrend.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    supertrend = np.asarray(supertrend, dtype=np.float64)
+    uptrend = np.zeros(len(close), dtype=bool)
+    uptrend[1:] = close[1:] > supertrend[:-1]
+    return uptrend
+
 # Function to detect trends based on the relationship between Close and SuperTrend
+@stage('trend_detection')
 def trend_detection(data):
-    trend = []
-    # Loop through each data point to determine whether the trend is up or down
-    for current in range(0, len(data.index)):
-        previous = current - 1
-        # If the close price is above the SuperTrend, it's an uptrend
-        if data['Close'][current] > data['SuperTrend'][previous]:
-            trend.append('Uptrend')
-        # Otherwise, it's a downtrend
-        else:
-            trend.append('Downtrend')
-    
-    # Add 'Trend' column to data to store the trend information
-    data['Trend'] = trend
+    # If the close price is above the previous SuperTrend it's an uptrend, otherwise a downtrend
+    uptrend = trend_flags(data['Close'].to_numpy(dtype=np.float64), data['SuperTrend'].to_numpy(dtype=np.float64))
+
+    # Add a categorical 'Trend' column (one byte per row) to store the trend information
+    data['Trend'] = pd.Categorical.from_codes(uptrend.astype(np.int8), categories=TREND_LABELS)
     return data
 
-# Function to simulate the trading strategy using PSAR and SuperTrend
-def psarst_sim_with_trailing_stop(data):
-    # Detect trends in the data
-    data = trend_detection(data)
-    
+# Signal codes of the int8 'Signal' column, and their display labels
+NO_ACTION, BUY, HOLD, SELL = 0, 1, 2, 3
+SIGNAL_LABELS = np.array(['No action', 'Buy', 'Hold', 'Sell'], dtype=object)
+
+# One row per trade; a position still open on the last bar has exit_index -1 and NaN exit fields
+TRADE_DTYPE = np.dtype([
+    ('entry_index', np.int64),
+    ('exit_index', np.int64),
+    ('entry_price', np.float64),
+    ('exit_price', np.float64),
+    ('shares', np.float64),
+    ('pnl', np.float64),
+])
+TRADING_DAYS = 252  # Bars per year used to annualise the Sharpe ratio
+
+# Entry / trailing-stop / target state machine, filling signals in place and returning the trades
+# as (entry_index, exit_index, entry_price, exit_price, shares, pnl) tuples of floats. Runs as plain
+# Python on lists, or compiled by numba on arrays (see psarst_kernels)
+def _trade_loop(close, low, atr, sar, uptrend, var, target_atr, signals):
+    trades = []  # List to track the trades
     buy_position = 0  # No open position initially
-    capital = 100000  # Starting capital
-    var = 0.01 * capital  # 1% of capital for each trade
-    buy_price = 0  # Initialize buy price
-    total_return = 0  # Total return
-    number_of_trades = 0  # Number of trades
-    returns_per_trade = []  # List to track returns per trade
-
-    # Add a column for trade signals ('Buy', 'Sell', 'Hold')
-    data['Signal'] = 'No action'
-
-    # Loop through each data point to simulate trades
-    for current in range(len(data.index)):
+    entry_index = buy_price = trailing_stop_loss = target_price = num_of_shares = capital_traded = 0.0
+
+    for current in range(len(close)):
         previous = current - 1
         if buy_position == 0:  # No position open
             # Check for an uptrend and SuperTrend buy signal
-            if data['Trend'][current] == 'Uptrend' and previous >= 0:
-                if data['SAR'][previous] < data['Close'][current]:
-                    data['Signal'][current] = 'Buy'
+            if uptrend[current] and previous >= 0:
+                # A close exactly at the previous low leaves no room for the stop loss, so no entry
+                if sar[previous] < close[current] and close[current] != low[previous]:
+                    signals[current] = BUY
                     buy_position += 1  # Open a buy position
-                    buy_price = data['Close'][current]  # Record buy price
-                    stop_loss = data['Low'][previous]  # Initial stop loss
+                    entry_index = float(current)
+                    buy_price = close[current]  # Record buy price
+                    stop_loss = low[previous]  # Initial stop loss
                     trailing_stop_loss = stop_loss  # Initialize trailing stop loss
-                    target_price = buy_price + (data['ATR'][current] * 3)  # Set target price
+                    target_price = buy_price + (atr[current] * target_atr)  # Set target price
                     num_of_shares = var / (buy_price - stop_loss)  # Calculate number of shares to buy
                     capital_traded = num_of_shares * buy_price  # Capital invested in this trade
 
         elif buy_position == 1:  # Position is open
             # Update trailing stop loss
-            trailing_stop_loss = max(trailing_stop_loss, data['Close'][current] - data['ATR'][current])
-            
+            trailing_stop_loss = max(trailing_stop_loss, close[current] - atr[current])
+
             # Check if trailing stop loss or target price is hit
-            if data['Close'][current] <= trailing_stop_loss or data['Close'][current] >= target_price:
-                data['Signal'][current] = 'Sell'
+            if close[current] <= trailing_stop_loss or close[current] >= target_price:
+                signals[current] = SELL
                 buy_position = 0  # Close the position
-                sell_price = data['Close'][current]  # Record sell price
+                sell_price = close[current]  # Record sell price
                 capital_rec = sell_price * num_of_shares  # Capital received from selling
-                return_per_trade = capital_rec - capital_traded  # Calculate return per trade
-                returns_per_trade.append(return_per_trade)  # Append return to list
-                total_return += return_per_trade  # Add to total return
-                number_of_trades += 1  # Increment the number of trades
+                trades.append((entry_index, float(current), buy_price, sell_price, num_of_shares,
+                               capital_rec - capital_traded))
             else:
-                data['Signal'][current] = 'Hold'  # Hold the position if neither stop nor target is hit
+                signals[current] = HOLD  # Hold the position if neither stop nor target is hit
+
+    if buy_position == 1:  # Record the position left open at the end
+        trades.append((entry_index, -1.0, buy_price, np.nan, num_of_shares, np.nan))
+    return trades
+
+def simulate_trades(close, low, atr, sar, uptrend, var, target_atr=3):
+    """
+    Run the entry / trailing-stop / target state machine over one symbol's bars.
+
+    The inputs are arrays (or sequences) of equal length. Returns (signals,
+    ledger): an int8 array with one signal code per bar and a TRADE_DTYPE
+    structured array with one row per trade. A bar whose close equals the
+    previous bar's low gives no entry, since the risk-based position size
+    would divide by zero. Uses the compiled kernel when numba is available.
+    """
+    trade_loop = psarst_kernels.compiled(_trade_loop)
+    if trade_loop is not None:
+        signals = np.zeros(len(close), dtype=np.int8)
+        trades = trade_loop(np.asarray(close, dtype=np.float64), np.asarray(low, dtype=np.float64),
+                            np.asarray(atr, dtype=np.float64), np.asarray(sar, dtype=np.float64),
+                            np.asarray(uptrend, dtype=np.bool_), float(var), float(target_atr), signals)
+    else:
+        # Plain Python floats in lists are much faster to loop over than NumPy scalars
+        columns = [np.asarray(values).tolist() for values in (close, low, atr, sar, uptrend)]
+        signals = bytearray(len(close))  # Preallocated, one byte per bar (NO_ACTION is 0)
+        trades = _trade_loop(*columns, var, target_atr, signals)
+        signals = np.frombuffer(signals, dtype=np.int8)
+
+    ledger = np.zeros(len(trades), dtype=TRADE_DTYPE)
+    if trades:
+        values = np.array(trades, dtype=np.float64)
+        for i, name in enumerate(TRADE_DTYPE.names):
+            ledger[name] = values[:, i]
+    return signals, ledger
+
+def closed_trades(ledger):
+    return ledger[ledger['exit_index'] >= 0]
+
+def equity_curve(close, ledger, capital):
+    """
+    Mark-to-market account value per bar: capital plus realised P&L plus the open position's gain.
+
+    Built from the ledger with cumulative sums, without a per-bar loop.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    exits = np.where(ledger['exit_index'] >= 0, ledger['exit_index'], n)
+    entries = ledger['entry_index']
+
+    # Shares held and their cost: added on the entry bar, removed on the exit bar
+    shares = np.zeros(n + 1)
+    cost = np.zeros(n + 1)
+    np.add.at(shares, entries, ledger['shares'])
+    np.add.at(shares, exits, -ledger['shares'])
+    np.add.at(cost, entries, ledger['shares'] * ledger['entry_price'])
+    np.add.at(cost, exits, -ledger['shares'] * ledger['entry_price'])
+
+    realised = np.zeros(n + 1)
+    closed = exits < n
+    np.add.at(realised, exits[closed], ledger['pnl'][closed])
+
+    equity = np.empty(n)
+    np.cumsum(realised[:n], out=equity)
+    equity += capital + np.cumsum(shares[:n]) * close - np.cumsum(cost[:n])
+    return equity
 
-    # Calculate overall return percentage and performance metrics
+# Function to calculate performance metrics from the trade ledger and the equity curve
+def trade_metrics(ledger, equity, capital):
+    returns_per_trade = closed_trades(ledger)['pnl']
+    number_of_trades = len(returns_per_trade)
+    total_return = sum(returns_per_trade.tolist())  # Total realised return
     return_percent = (total_return / capital) * 100
-    mean_pnl = np.mean(returns_per_trade)
-    std_dev_pnl = np.std(returns_per_trade, ddof=1)
-    sharpe_ratio = np.sqrt(number_of_trades) * (mean_pnl / std_dev_pnl) if std_dev_pnl != 0 else 0
-    loss_count = len(list(filter(lambda x: x < 0, returns_per_trade)))  # Count of losing trades
-    win_count = len(list(filter(lambda x: x > 0, returns_per_trade)))  # Count of winning trades
+    win_count = int(np.count_nonzero(returns_per_trade > 0))  # Count of winning trades
+    loss_count = int(np.count_nonzero(returns_per_trade < 0))  # Count of losing trades
     win_rate = win_count / number_of_trades if number_of_trades > 0 else 0  # Winning percentage
 
-    # Print trade performance metrics
-    print('Total Returns: ', total_return)
-    print('Total Number of Trades: ', number_of_trades)
-    print("Returns (%): {}%".format(return_percent))
-    print('Sharpe Ratio: ', sharpe_ratio)
-    print('Win Rate: {}%'.format(win_rate * 100))
-    if number_of_trades > 0:
-        max_drawdown = ((min([x + capital for x in returns_per_trade]) - 
-                         max([x + capital for x in returns_per_trade])) /
-                         max([x + capital for x in returns_per_trade])) * 100
-        print('Max Drawdown: ', max_drawdown)
+    # Annualised Sharpe ratio of the per-bar P&L relative to the starting capital. Position sizes are
+    # not limited by the account value, so equity can fall to zero or below and returns on it are meaningless
+    bar_returns = np.diff(equity) / capital
+    std_dev = np.std(bar_returns, ddof=1) if len(bar_returns) > 1 else 0
+    sharpe_ratio = float(np.sqrt(TRADING_DAYS) * np.mean(bar_returns) / std_dev) if std_dev > 0 else 0
+
+    # Deepest fall of the equity curve below its running peak, in percent; NaN once the account is wiped out
+    if len(ledger) == 0:
+        max_drawdown = None
+    elif equity.min() <= 0:
+        max_drawdown = float('nan')
     else:
+        peak = np.maximum.accumulate(equity)
+        max_drawdown = float(((equity - peak) / peak).min() * 100)
+
+    # Fraction of bars with a position open after the bar's close
+    held = np.zeros(len(equity) + 1, dtype=np.int64)
+    np.add.at(held, ledger['entry_index'], 1)
+    np.add.at(held, np.where(ledger['exit_index'] >= 0, ledger['exit_index'], len(equity)), -1)
+    exposure = float(np.count_nonzero(np.cumsum(held[:-1])) / len(equity)) if len(equity) else 0.0
+
+    return {
+        'total_return': total_return,
+        'number_of_trades': number_of_trades,
+        'return_percent': return_percent,
+        'sharpe_ratio': sharpe_ratio,
+        'win_count': win_count,
+        'loss_count': loss_count,
+        'win_rate': win_rate,
+        'max_drawdown': max_drawdown,
+        'exposure': exposure,
+    }
+
+# Function to print trade performance metrics
+def print_metrics(metrics):
+    print('Total Returns: ', metrics['total_return'])
+    print('Total Number of Trades: ', metrics['number_of_trades'])
+    print("Returns (%): {}%".format(metrics['return_percent']))
+    print('Sharpe Ratio: ', metrics['sharpe_ratio'])
+    print('Win Rate: {}%'.format(metrics['win_rate'] * 100))
+    if metrics['max_drawdown'] is None:
         print('Max Drawdown: N/A (No trades made)')
-    
+    elif np.isnan(metrics['max_drawdown']):
+        print('Max Drawdown: N/A (Equity fell to zero or below)')
+    else:
+        print('Max Drawdown: ', metrics['max_drawdown'])
+    print('Exposure: {}%'.format(metrics['exposure'] * 100))
+
+@stage('psarst_backtest')
+def psarst_backtest(data, capital=100000, risk=0.01, target_atr=3):
+    """
+    Run the PSAR + SuperTrend strategy and return (data, ledger, metrics).
+
+    The needed columns are pulled into arrays once and the state machine runs
+    over them. 'Signal' (int8 signal codes) and 'Equity' (account value per
+    bar) are added to data; ledger is the TRADE_DTYPE trade array. An existing
+    'Trend' column is reused instead of being recomputed.
+    """
+    # Detect trends in the data, reusing a 'Trend' column computed earlier
+    if 'Trend' not in data.columns:
+        data = trend_detection(data)
+
+    var = risk * capital  # Capital risked on each trade
+    close = data['Close'].to_numpy(dtype=np.float64)
+    signals, ledger = simulate_trades(
+        close,
+        data['Low'].to_numpy(dtype=np.float64),
+        data['ATR'].to_numpy(dtype=np.float64),
+        data['SAR'].to_numpy(dtype=np.float64),
+        (data['Trend'] == 'Uptrend').to_numpy(dtype=bool),
+        var,
+        target_atr,
+    )
+    equity = equity_curve(close, ledger, capital)
+
+    # Add the trade signals (see SIGNAL_LABELS) and the equity curve
+    data['Signal'] = signals
+    data['Equity'] = equity
+    return data, ledger, trade_metrics(ledger, equity, capital)
+
+# Function to simulate the trading strategy using PSAR and SuperTrend
+def psarst_sim_with_trailing_stop(data):
+    data, ledger, metrics = psarst_backtest(data)
+    print_metrics(metrics)
     return data
 
+# Function to thin a line series to at most four points (first, last, min, max) per pixel column
+def decimate(x, y, n_buckets):
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= 4 * n_buckets:
+        return x, y
+
+    starts = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    bucket = np.repeat(np.arange(n_buckets), np.diff(starts))
+    # Sorting by (bucket, value) puts each bucket's minimum first and maximum last
+    order = np.lexsort((y, bucket))
+    keep = np.concatenate([starts[:-1], starts[1:] - 1, order[starts[:-1]], order[starts[1:] - 1]])
+    keep = np.unique(keep)
+    return x[keep], y[keep]
+
+# Function to draw resampled OHLC candles with two artists per colour instead of two per candle
+def _fast_candlesticks(ax, data_ohlc, width=2, colorup='g', colordown='r'):
+    from matplotlib.patches import PathPatch
+    from matplotlib.path import Path
+
+    data_ohlc = data_ohlc.dropna()
+    t, o, h, l, c = (data_ohlc[column].to_numpy(dtype=np.float64)
+                     for column in ['Date', 'open', 'high', 'low', 'close'])
+    up = c >= o
+    for color, rows in ((colorup, up), (colordown, ~up)):
+        t_, o_, h_, l_, c_ = t[rows], o[rows], h[rows], l[rows], c[rows]
+
+        # Wicks: one polyline broken by NaN gaps
+        gaps = np.full(len(t_), np.nan)
+        ax.plot(np.column_stack([t_, t_, gaps]).ravel(), np.column_stack([l_, h_, gaps]).ravel(),
+                color=color, linewidth=0.5)
+
+        # Bodies: one compound path of closed rectangles
+        left, right = t_ - width / 2, t_ + width / 2
+        bottom, top = np.minimum(o_, c_), np.maximum(o_, c_)
+        vertices = np.stack([np.column_stack([left, bottom]), np.column_stack([right, bottom]),
+                             np.column_stack([right, top]), np.column_stack([left, top]),
+                             np.column_stack([left, bottom])], axis=1).reshape(-1, 2)
+        codes = np.tile([Path.MOVETO, Path.LINETO, Path.LINETO, Path.LINETO, Path.CLOSEPOLY], len(t_))
+        if len(t_) > 0:
+            # add_artist + update_datalim skips add_patch's per-segment extent walk
+            patch = PathPatch(Path(vertices, codes), facecolor=color, edgecolor=color)
+            patch.set_clip_path(ax.patch)
+            ax.add_artist(patch)
+            ax.update_datalim(vertices)
+    ax.autoscale_view()
+
 # Function to plot the results, including the price chart, indicators, and signals
-def psarst_plot(data):
-    style.use('ggplot')
-    # Create a 4-row subplot for different graphs
-    # fig, axes = plt.subplots(4, 1, figsize=(15, 20), gridspec_kw={'height_ratios': [3, 1, 1, 1]})
-    fig, axes = plt.subplots(4, 1, figsize=(18, 25), gridspec_kw={'height_ratios': [3, 1, 1, 1]})
+@stage('psarst_plot')
+def psarst_plot(data, path=None, dpi=100):
+    """
+    Plot price, SAR, SuperTrend, RSI, ATR and volume with the trade signals.
 
-    
-    # Main price chart with buy/sell signals
-    ax1 = axes[0]
-    ax1.xaxis_date()
-    # Plot Buy and Sell signals on the price chart
-    for current in range(0, len(data.index)):
-        if data['Signal'][current] == 'Buy':
-            ax1.text(data.index[current], data['Close'][current], 'Buy',
-                     bbox={'facecolor': 'green', 'alpha': 0.5, 'pad': 2})
-        elif data['Signal'][current] == 'Sell':
-            ax1.text(data.index[current], data['Close'][current], 'Sell',
-                     bbox={'facecolor': 'red', 'alpha': 0.5, 'pad': 2})
-    
-    # Prepare data for candlestick chart (resampling data every 10 days)
-    data_ohlc = data['Close'].resample('10D').ohlc()
-    data_volume = data['Volume'].resample('10D').sum()
-    data_ohlc.reset_index(inplace=True)
-    data_ohlc['Date'] = data_ohlc['Date'].map(mdates.date2num)
-    
-    # Plot candlestick chart
-    candlestick_ohlc(ax1, data_ohlc.values, width=2, colorup='g', colordown='r')
-    ax1.plot(data.index, data['SAR'], marker='.', linestyle='None', color='blue', label='SAR')  # SAR line
-    ax1.plot(data.index, data['SuperTrend'], color='magenta', label='SuperTrend')  # SuperTrend line
-    ax1.set_title('Price Chart with SAR and SuperTrend')
-    ax1.legend()
-    
-    # RSI subplot
-    ax2 = axes[1]
-    ax2.plot(data.index, data['RSI'], color='purple', label='RSI')
-    ax2.axhline(70, color='red', linestyle='--', linewidth=0.7, label='Overbought')  # Overbought level
-    ax2.axhline(30, color='green', linestyle='--', linewidth=0.7, label='Oversold')  # Oversold level
-    ax2.set_title('Relative Strength Index (RSI)')
-    ax2.legend()
-    
-    # ATR subplot
-    ax3 = axes[2]
-    ax3.plot(data.index, data['ATR'], color='orange', label='ATR')
-    ax3.set_title('Average True Range (ATR)')
-    ax3.legend()
-    
-    # Volume subplot
-    ax4 = axes[3]
-    ax4.fill_between(data.index, data['Volume'], color='blue', alpha=0.5)
-    ax4.set_title('Volume')
-    
-    plt.subplots_adjust(hspace=0.3, wspace=0.3)
-    plt.tight_layout(pad = 3.0)  # Adjust layout for better spacing
-    plt.show()
-
-# Set the parameters for data extraction and simulation
-# years = 10
-years = int(input("Enter Number of Years: "))
-end_date = dt.datetime.now()
-start_date = end_date - dt.timedelta(days=365 * years)
-# ticker = 'TATASTEEL.NS'
-input_ticker = input("Enter Symbol: ")
-ticker = input_ticker + ".NS"
-data = extract_data(ticker, start_date, end_date)
-
-# Apply indicators, detect trends, simulate strategy, and plot results
-indicator_data = indicators(data)
-trend_data = trend_detection(indicator_data)
-sim_data = psarst_sim_with_trailing_stop(indicator_data)
-psarst_plot(sim_data)
+    Without a path the chart is shown interactively. With a path (.png, .svg,
+    ...) it is rendered headless with the Agg backend and written to disk:
+    signals are drawn as two scatter collections, candles as two collections
+    and line series are decimated to the pixel width of the figure.
+    """
+    from matplotlib import style
+    import matplotlib.dates as mdates
+
+    headless = path is not None
+    figsize = (18, 25)
+    with style.context('ggplot'):
+        # Create a 4-row subplot for different graphs
+        if headless:
+            from matplotlib.figure import Figure
+            fig = Figure(figsize=figsize, dpi=dpi)  # Rendered with Agg, no GUI and no pyplot state
+            axes = fig.subplots(4, 1, gridspec_kw={'height_ratios': [3, 1, 1, 1]})
+        else:
+            import matplotlib.pyplot as plt
+            fig, axes = plt.subplots(4, 1, figsize=figsize, gridspec_kw={'height_ratios': [3, 1, 1, 1]})
+
+        # Pixel columns available to each axis; line series never need more points than that
+        n_buckets = max(int(figsize[0] * dpi), 1)
+        def line(column):
+            if headless:
+                return decimate(data.index.to_numpy(), data[column].to_numpy(dtype=np.float64), n_buckets)
+            return data.index, data[column]
+
+        # Main price chart with buy/sell signals
+        ax1 = axes[0]
+        ax1.xaxis_date()
+        signal = data['Signal'].to_numpy()
+        close = data['Close'].to_numpy(dtype=np.float64)
+        buys, sells = np.flatnonzero(signal == BUY), np.flatnonzero(signal == SELL)
+        if headless:
+            # Plot Buy and Sell signals as one scatter collection each
+            ax1.scatter(data.index[buys], close[buys], marker='^', color='green', s=40, zorder=3, label='Buy')
+            ax1.scatter(data.index[sells], close[sells], marker='v', color='red', s=40, zorder=3, label='Sell')
+        else:
+            # Plot Buy and Sell signals on the price chart
+            for current in buys:
+                ax1.text(data.index[current], close[current], 'Buy',
+                         bbox={'facecolor': 'green', 'alpha': 0.5, 'pad': 2})
+            for current in sells:
+                ax1.text(data.index[current], close[current], 'Sell',
+                         bbox={'facecolor': 'red', 'alpha': 0.5, 'pad': 2})
+
+        # Prepare data for candlestick chart (resampling data every 10 days)
+        data_ohlc = data['Close'].resample('10D').ohlc()
+        data_ohlc.reset_index(inplace=True)
+        data_ohlc['Date'] = data_ohlc['Date'].map(mdates.date2num)
+
+        # Plot candlestick chart
+        if headless:
+            _fast_candlesticks(ax1, data_ohlc, width=2, colorup='g', colordown='r')
+        else:
+            from mplfinance.original_flavor import candlestick_ohlc
+            candlestick_ohlc(ax1, data_ohlc.values, width=2, colorup='g', colordown='r')
+        ax1.plot(*line('SAR'), marker='.', linestyle='None', color='blue', label='SAR')  # SAR line
+        ax1.plot(*line('SuperTrend'), color='magenta', label='SuperTrend')  # SuperTrend line
+        ax1.set_title('Price Chart with SAR and SuperTrend')
+        ax1.legend()
+
+        # RSI subplot
+        ax2 = axes[1]
+        ax2.plot(*line('RSI'), color='purple', label='RSI')
+        ax2.axhline(70, color='red', linestyle='--', linewidth=0.7, label='Overbought')  # Overbought level
+        ax2.axhline(30, color='green', linestyle='--', linewidth=0.7, label='Oversold')  # Oversold level
+        ax2.set_title('Relative Strength Index (RSI)')
+        ax2.legend()
+
+        # ATR subplot
+        ax3 = axes[2]
+        ax3.plot(*line('ATR'), color='orange', label='ATR')
+        ax3.set_title('Average True Range (ATR)')
+        ax3.legend()
+
+        # Volume subplot
+        ax4 = axes[3]
+        ax4.fill_between(*line('Volume'), color='blue', alpha=0.5)
+        ax4.set_title('Volume')
+
+        fig.subplots_adjust(hspace=0.3, wspace=0.3)
+        fig.tight_layout(pad = 3.0)  # Adjust layout for better spacing
+        if headless:
+            # Fast zlib level for PNG; the default spends most of the time compressing
+            options = {'pil_kwargs': {'compress_level': 1}} if str(path).lower().endswith('.png') else {}
+            fig.savefig(path, dpi=dpi, **options)
+        else:
+            plt.show()
+
+# Every parameter of backtest_pipeline with its default, so memoization keys do not depend on how it is called
+BACKTEST_PARAMETERS = {
+    'rsi_length': 14,
+    'atr_length': 14,
+    'st_length': 10,
+    'st_multiplier': 3,
+    'acceleration': 0.02,
+    'max_acceleration': 0.2,
+    'capital': 100000,
+    'risk': 0.01,
+    'target_atr': 3,
+}
+
+def backtest_pipeline(data, capital=100000, risk=0.01, target_atr=3, **indicator_params):
+    """Apply indicators, detect trends and simulate the strategy; returns (data, ledger, metrics)."""
+    trend_data = trend_detection(indicators(data, **indicator_params))
+    return psarst_backtest(trend_data, capital=capital, risk=risk, target_atr=target_atr)
+
+def memoized_backtest(data, results, **params):
+    """
+    backtest_pipeline with its result looked up in a ResultCache first.
+
+    The key covers the OHLCV values, every parameter and the code version, so
+    a repeated request returns the stored indicator frame, ledger and metrics
+    while changed data or code computes afresh.
+    """
+    params = dict(BACKTEST_PARAMETERS, **params)
+    key = fingerprint(data, stage='backtest_pipeline', **params)
+    return results.memoize(key, lambda: backtest_pipeline(data.copy(), **params))
+
+# Function to run the whole pipeline for one ticker: download, indicators, trend, simulation, plot
+@stage('run_pipeline')
+def run_pipeline(ticker, start_date, end_date, cache=None, plot=True, plot_path=None, results=None):
+    data = extract_data(ticker, start_date, end_date, cache=cache)
+
+    # Apply indicators, detect trends and simulate strategy (reusing a stored result if possible), and plot results
+    if results is not None:
+        sim_data, ledger, metrics = memoized_backtest(data, results)
+    else:
+        sim_data, ledger, metrics = backtest_pipeline(data)
+    print_metrics(metrics)
+    if plot:
+        psarst_plot(sim_data, path=plot_path)
+    return sim_data
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backtest the PSAR + SuperTrend strategy on one NSE symbol.')
+    parser.add_argument('--symbol', help='Symbol to backtest, e.g. TATASTEEL (prompted for if omitted)')
+    parser.add_argument('--years', type=int, help='Number of years of history (prompted for if omitted)')
+    parser.add_argument('--suffix', default='.NS', help='Exchange suffix appended to the symbol')
+    parser.add_argument('--no-cache', action='store_true', help='Always download fresh data')
+    parser.add_argument('--no-result-cache', action='store_true', help='Always recompute the backtest')
+    parser.add_argument('--no-plot', action='store_true', help='Skip the chart')
+    parser.add_argument('--plot-file', help='Save the chart to this file (.png, .svg) instead of showing it')
+    parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                        help='Record per-stage timing and memory as JSON lines (stderr if no file is given)')
+    parser.add_argument('--profile-dir', help='With --profile, also write a cProfile dump per stage call here')
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        psarst_profile.configure(args.profile, args.profile_dir)
+
+    # Set the parameters for data extraction and simulation
+    years = args.years if args.years is not None else int(input("Enter Number of Years: "))
+    end_date = dt.datetime.now()
+    start_date = end_date - dt.timedelta(days=365 * years)
+    input_ticker = args.symbol if args.symbol is not None else input("Enter Symbol: ")
+    ticker = input_ticker + args.suffix
+
+    cache = None if args.no_cache else OHLCVCache()
+    results = None if args.no_result_cache else ResultCache()
+    return run_pipeline(ticker, start_date, end_date, cache=cache, plot=not args.no_plot, plot_path=args.plot_file,
+                        results=results)
+
+if __name__ == "__main__":
+    main()
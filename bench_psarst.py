@@ -0,0 +1,778 @@
+import argparse
+import contextlib
+import datetime as dt
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+import numpy as np
+import pandas as pd
+
+import psarst_kernels
+from PSARST import (BACKTEST_PARAMETERS, BUY, HOLD, NO_ACTION, SELL, SIGNAL_LABELS, TRADING_DAYS, backtest_pipeline,
+                    calculate_sar, closed_trades, indicators, memoized_backtest, psarst_backtest, run_pipeline,
+                    sar_kernel, simulate_trades, trend_detection, trend_flags)
+from psarst_batch import run_batch
+from psarst_cache import OHLCVCache
+from psarst_fetch import ChartStandIn, download, store_in_cache
+from psarst_memo import ResultCache
+from psarst_optimize import DEFAULT_PARAMETERS, RANK_COLUMNS, sweep
+from psarst_portfolio import simulate_portfolio
+from psarst_store import build_store, indicator_block
+from psarst_walkforward import WINDOW_COLUMNS, walk_forward
+from psarst_stream import StreamingSignals, replay
+
+
+# Import-time budget for a plain "import PSARST", and modules it must not load eagerly
+IMPORT_BUDGET_MS = 750
+LAZY_MODULES = ['yfinance', 'pandas_ta', 'matplotlib', 'mplfinance', 'numba']
+
+# Baseline throughputs and the allowed slowdown before the suite fails
+BASELINE_FILE = 'bench_baseline.json'
+REGRESSION_THRESHOLD = 0.2
+REFERENCE_CASES = ['calculate_sar_legacy']  # Timed for comparison only, never gated
+
+
+# Original per-element implementation of calculate_sar, kept as the "before" reference
+def legacy_calculate_sar(high, low, acceleration=0.02, max_acceleration=0.2):
+    sar = []
+    af = acceleration
+    ep = low[0]
+    is_long = True
+    prev_sar = low[0]
+
+    for i in range(len(high)):
+        if i == 0:
+            sar.append(prev_sar)
+            continue
+
+        current_sar = prev_sar + af * (ep - prev_sar)
+
+        if is_long:
+            if current_sar > low[i]:
+                is_long = False
+                current_sar = ep
+                af = acceleration
+                ep = high[i]
+            else:
+                if high[i] > ep:
+                    ep = high[i]
+                    af = min(af + acceleration, max_acceleration)
+        else:
+            if current_sar < high[i]:
+                is_long = True
+                current_sar = ep
+                af = acceleration
+                ep = low[i]
+            else:
+                if low[i] < ep:
+                    ep = low[i]
+                    af = min(af + acceleration, max_acceleration)
+
+        prev_sar = current_sar
+        sar.append(current_sar)
+
+    return pd.Series(sar, index=high.index)
+
+# Original per-element trend detection and trade loop of psarst_sim_with_trailing_stop, kept as the
+# reference for the simulator; returns the signal labels and the P&L of each closed trade
+def legacy_simulate(data, capital=100000, risk=0.01, target_atr=3):
+    close, low, atr, sar, supertrend = (data[column] for column in ['Close', 'Low', 'ATR', 'SAR', 'SuperTrend'])
+    buy_position = 0
+    var = risk * capital
+    returns_per_trade = []
+    signals = ['No action'] * len(data.index)
+
+    for current in range(len(data.index)):
+        previous = current - 1
+        if buy_position == 0:
+            if previous >= 0 and close.iloc[current] > supertrend.iloc[previous]:
+                if sar.iloc[previous] < close.iloc[current]:
+                    signals[current] = 'Buy'
+                    buy_position += 1
+                    buy_price = close.iloc[current]
+                    stop_loss = low.iloc[previous]
+                    trailing_stop_loss = stop_loss
+                    target_price = buy_price + (atr.iloc[current] * target_atr)
+                    num_of_shares = var / (buy_price - stop_loss)
+                    capital_traded = num_of_shares * buy_price
+
+        elif buy_position == 1:
+            trailing_stop_loss = max(trailing_stop_loss, close.iloc[current] - atr.iloc[current])
+            if close.iloc[current] <= trailing_stop_loss or close.iloc[current] >= target_price:
+                signals[current] = 'Sell'
+                buy_position = 0
+                sell_price = close.iloc[current]
+                capital_rec = sell_price * num_of_shares
+                returns_per_trade.append(capital_rec - capital_traded)
+            else:
+                signals[current] = 'Hold'
+
+    return signals, returns_per_trade
+
+REFERENCE_PANDAS_TA = '0.3.14b0'
+
+# pandas_ta 0.3.14b0 (the version in psarst_requirements.txt, without TA-Lib) computes RSI, ATR and
+# SuperTrend as below. Kept as the reference the parity checks assume, since that release is no longer
+# on PyPI and later ones compute SuperTrend differently
+def reference_rma(values, length):
+    return values.ewm(alpha=1.0 / length, min_periods=length).mean()
+
+def reference_rsi(close, length=14):
+    negative = close.diff(1)
+    positive = negative.copy()
+    positive[positive < 0] = 0
+    negative[negative > 0] = 0
+    positive_avg = reference_rma(positive, length)
+    negative_avg = reference_rma(negative, length)
+    return 100 * positive_avg / (positive_avg + negative_avg.abs())
+
+def reference_atr(high, low, close, length=14):
+    high_low_range = high - low
+    if high_low_range.eq(0).any():
+        high_low_range += sys.float_info.epsilon
+    prev_close = close.shift(1)
+    true_range = pd.concat([high_low_range, high - prev_close, prev_close - low], axis=1).abs().max(axis=1)
+    true_range.iloc[:1] = np.nan
+    return reference_rma(true_range, length)
+
+def reference_supertrend(high, low, close, length=10, multiplier=3):
+    hl2 = 0.5 * (high + low)
+    matr = multiplier * reference_atr(high, low, close, length)
+    upperband = (hl2 + matr).to_numpy()
+    lowerband = (hl2 - matr).to_numpy()
+    close = close.to_numpy()
+    direction, trend = 1, np.zeros(len(close))
+    for i in range(1, len(close)):
+        if close[i] > upperband[i - 1]:
+            direction = 1
+        elif close[i] < lowerband[i - 1]:
+            direction = -1
+        else:
+            if direction > 0 and lowerband[i] < lowerband[i - 1]:
+                lowerband[i] = lowerband[i - 1]
+            if direction < 0 and upperband[i] > upperband[i - 1]:
+                upperband[i] = upperband[i - 1]
+        trend[i] = lowerband[i] if direction > 0 else upperband[i]
+    return pd.Series(trend, index=hl2.index)
+
+def reference_columns(data, rsi_length=14, atr_length=14, st_length=10, st_multiplier=3,
+                      acceleration=0.02, max_acceleration=0.2):
+    """The indicators() columns from the reference calculations, before rows with missing values are dropped."""
+    high, low, close = data['High'], data['Low'], data['Adj Close']
+    data = data[['Open', 'High', 'Low', 'Volume']].assign(
+        Close=close, RSI=reference_rsi(close, rsi_length), ATR=reference_atr(high, low, close, atr_length),
+        SuperTrend=reference_supertrend(high, low, close, st_length, st_multiplier),
+        SAR=calculate_sar(high, low, acceleration=acceleration, max_acceleration=max_acceleration))
+    return data[['Open', 'High', 'Low', 'Close', 'Volume', 'RSI', 'ATR', 'SuperTrend', 'SAR']]
+
+def reference_indicators(data, **params):
+    """indicators() with the reference pandas_ta calculations, on a raw OHLCV frame."""
+    return reference_columns(data, **params).dropna()
+
+# Function to report a check as skipped when pandas_ta, which indicators() needs, is not installed
+def skip_without_pandas_ta(name):
+    try:
+        import pandas_ta  # noqa: F401
+    except ImportError:
+        print('{}: skipped, pandas_ta is not installed'.format(name))
+        return True
+    return False
+
+# Function to compare two trade_metrics() dicts, missing values (None or NaN) matching each other
+def same_metrics(a, b):
+    return a.keys() == b.keys() and all(a[k] == b[k] or (pd.isna(a[k]) and pd.isna(b[k])) for k in a)
+
+# Function to find the first position where two indexes differ, or None when they are equal
+def first_index_difference(expected, actual):
+    if expected.equals(actual):
+        return None
+    return next(i for i, (a, b) in enumerate(itertools.zip_longest(expected, actual)) if a != b)
+
+# Function to find the first position where two value arrays differ (NaNs in the same place match)
+def first_difference(expected, actual, rtol=1e-12):
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    if expected.shape != actual.shape:
+        return min(len(expected), len(actual))
+    mismatch = np.flatnonzero(~np.isclose(actual, expected, rtol=rtol, atol=0, equal_nan=True))
+    return int(mismatch[0]) if len(mismatch) else None
+
+# Function to build a bar index: business days while they fit in pandas' date range, minutes beyond that
+def synthetic_index(n_bars):
+    freq = 'B' if n_bars <= 50000 else 'min'
+    return pd.date_range('2000-01-03', periods=n_bars, freq=freq, name='Date')
+
+# Function to build a seeded random-walk OHLCV frame shaped like a yfinance download
+def synthetic_ohlcv(n_bars, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, n_bars)))
+    open_ = close * (1 + rng.normal(0, 0.003, n_bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.006, n_bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.006, n_bars)))
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Adj Close': close,
+                         'Volume': rng.integers(100000, 10000000, n_bars).astype(np.float64)},
+                        index=synthetic_index(n_bars))
+
+# Function to build a seeded (bars x symbols) high/low block for the multi-symbol SAR kernel
+def synthetic_high_low(n_bars, n_symbols, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, (n_bars, n_symbols)), axis=0))
+    spread = np.abs(rng.normal(0, 0.01, (n_bars, n_symbols)))
+    index = synthetic_index(n_bars)
+    columns = ['SYM{}'.format(i) for i in range(n_symbols)]
+    high = pd.DataFrame(close * (1 + spread), index=index, columns=columns)
+    low = pd.DataFrame(close * (1 - spread), index=index, columns=columns)
+    return high, low
+
+class SyntheticSource:
+    """
+    Offline stand-in for Yahoo Finance: a seeded OHLCV history per ticker.
+
+    Called like the cache's data source, (ticker, start_date, end_date) ->
+    DataFrame. The same ticker always gets the same history.
+    """
+
+    def __init__(self, n_bars):
+        self.n_bars = n_bars
+
+    def __call__(self, ticker, start_date, end_date):
+        data = synthetic_ohlcv(self.n_bars, seed=zlib.crc32(ticker.encode()))
+        return data[(data.index >= start_date) & (data.index < end_date)]
+
+    def date_range(self):
+        """Start and end dates covering every generated bar."""
+        index = synthetic_index(self.n_bars)
+        return index[0].to_pydatetime(), (index[-1] + pd.Timedelta(days=1)).to_pydatetime()
+
+# Function to time a callable and return the best wall time over several repeats
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# Function to run the script pipeline (download -> indicators -> trend -> simulation) on synthetic data
+def synthetic_pipeline(source, start_date, end_date):
+    with tempfile.TemporaryDirectory() as cache_dir, contextlib.redirect_stdout(io.StringIO()):
+        return run_pipeline('SYM0', start_date, end_date, cache=OHLCVCache(cache_dir, source=source), plot=False)
+
+def bench_cases(n_bars, n_symbols, repeat):
+    """Time each stage and the full pipeline; return {case: bars per second}."""
+    results = {}
+    def record(name, bars, func):
+        results['{}[bars={},symbols={}]'.format(name, n_bars, n_symbols)] = bars / best_time(func, repeat)
+
+    source = SyntheticSource(n_bars)
+    start_date, end_date = source.date_range()
+
+    if n_symbols == 1:
+        data = source('SYM0', start_date, end_date)
+        indicator_data = indicators(data.copy())
+        trend_data = trend_detection(indicator_data.copy())
+        if n_bars <= 1000000:  # The old loop is too slow to be worth timing beyond this
+            record('calculate_sar_legacy', n_bars, lambda: legacy_calculate_sar(data['High'], data['Low']))
+        record('calculate_sar', n_bars, lambda: calculate_sar(data['High'], data['Low']))
+        record('indicators', n_bars, lambda: indicators(data.copy()))
+        record('trend_detection', len(indicator_data), lambda: trend_detection(indicator_data.copy()))
+        record('psarst_backtest', len(trend_data), lambda: psarst_backtest(trend_data.copy()))
+        record('pipeline', n_bars, lambda: synthetic_pipeline(source, start_date, end_date))
+    else:
+        high, low = synthetic_high_low(n_bars, n_symbols)
+        record('calculate_sar_block', n_bars * n_symbols, lambda: calculate_sar(high, low))
+        jobs = [('SYM{}'.format(i), start_date, end_date) for i in range(n_symbols)]
+        record('batch', n_bars * n_symbols, lambda: run_batch(jobs, cache_dir=None, source=source))
+    return results
+
+def compare_with_baseline(results, baseline, threshold):
+    """Print the results next to the baseline and return the cases slower than allowed."""
+    regressions = []
+    print('{:<52} {:>16} {:>16} {:>9}'.format('case', 'bars/s', 'baseline', 'change'))
+    for case, throughput in results.items():
+        reference = baseline.get(case)
+        if reference is None:
+            print('{:<52} {:>16,.0f} {:>16} {:>9}'.format(case, throughput, '-', '-'))
+            continue
+        change = throughput / reference - 1
+        print('{:<52} {:>16,.0f} {:>16,.0f} {:>+8.1f}%'.format(case, throughput, reference, change * 100))
+        if change < -threshold and case.split('[')[0] not in REFERENCE_CASES:
+            regressions.append(case)
+    return regressions
+
+def check_sar_parity(n_bars=10000, n_symbols=4):
+    """calculate_sar must match the original loop bit for bit, for Series and DataFrame input."""
+    high, low = synthetic_high_low(n_bars, n_symbols)
+    block = calculate_sar(high, low)
+    for column in high.columns:
+        expected = legacy_calculate_sar(high[column], low[column]).to_numpy()
+        if not np.array_equal(calculate_sar(high[column], low[column]).to_numpy(), expected):
+            raise AssertionError('calculate_sar (Series) differs from the legacy implementation')
+        if not np.array_equal(block[column].to_numpy(), expected):
+            raise AssertionError('calculate_sar (DataFrame) differs from the legacy implementation')
+    print('sar parity: {} bars x {} symbols match the legacy loop'.format(n_bars, n_symbols))
+
+def check_kernel_parity(n_bars=20000, n_symbols=4):
+    """The compiled (numba) and pure-Python kernels must give identical SAR, signals and trades."""
+    if not psarst_kernels.jit_enabled():
+        print('kernel parity: skipped, numba is not available or {} is set'.format(psarst_kernels.NO_JIT_ENV))
+        return
+    high, low = synthetic_high_low(n_bars, n_symbols)
+    backtest_input = trend_detection(reference_indicators(synthetic_ohlcv(n_bars)))
+    def run_kernels():
+        sar = sar_kernel(high.to_numpy(), low.to_numpy())
+        data, ledger, metrics = psarst_backtest(backtest_input.copy())
+        return [sar, data['Signal'].to_numpy(), ledger]
+
+    compiled = run_kernels()
+    psarst_kernels.disable()
+    try:
+        python = run_kernels()
+    finally:
+        psarst_kernels.reset()
+    for name, a, b in zip(['SAR', 'signals', 'trade ledger'], compiled, python):
+        if a.dtype != b.dtype or a.tobytes() != b.tobytes():  # Bytes, so NaN fields of an open trade compare equal
+            raise AssertionError('Compiled and pure-Python kernels differ in {}'.format(name))
+    print('kernel parity: compiled and pure-Python kernels match on {} bars'.format(n_bars))
+
+def check_simulator_parity(n_bars=3000, seeds=range(5)):
+    """
+    psarst_backtest must give the original loop's signals and per-trade P&L exactly.
+
+    Synthetic closes never equal the previous low, the one case where the
+    original divided by zero (check_zero_stop_distance covers it).
+    """
+    for seed in seeds:
+        data = trend_detection(reference_indicators(synthetic_ohlcv(n_bars, seed)))
+        expected_signals, expected_pnl = legacy_simulate(data)
+        backtest, ledger, metrics = psarst_backtest(data.copy())
+        signals = SIGNAL_LABELS[backtest['Signal'].to_numpy()]
+        bar = first_index_difference(pd.Index(expected_signals), pd.Index(signals))
+        if bar is not None:
+            raise AssertionError('Signals of seed {} differ from the original loop from bar {}: {} vs {}'.format(
+                seed, bar, signals[bar], expected_signals[bar]))
+        if not np.array_equal(closed_trades(ledger)['pnl'], np.array(expected_pnl, dtype=np.float64)):
+            raise AssertionError('Trade P&L of seed {} differs from the original loop'.format(seed))
+    print('simulator parity: {} seeds x {} bars match the original loop'.format(len(seeds), n_bars))
+
+def check_zero_stop_distance():
+    """
+    An entry bar closing at the previous bar's low (no room for the stop loss) must be skipped, not crash.
+
+    Runs the pure-Python and compiled trade loops and the streaming state machine on the same bars.
+    """
+    close, low = [10.0, 9.0, 9.5, 12.0, 12.5], [9.0, 8.0, 8.0, 11.0, 12.0]
+    atr, sar, supertrend = [1.0] * 5, [0.0] * 5, [0.0] * 5
+    uptrend = trend_flags(close, supertrend)
+    expected = [NO_ACTION, NO_ACTION, BUY, HOLD, SELL]  # Bar 1 closes at bar 0's low; bar 2 enters
+
+    stream = StreamingSignals(capital=100000, risk=0.01)  # Risks 1000 per trade, like the batch calls below
+    results = {'streaming': [stream.update(*bar) for bar in zip(close, low, atr, supertrend, sar)]}
+    psarst_kernels.disable()
+    try:
+        results['pure-Python'] = simulate_trades(close, low, atr, sar, uptrend, 1000.0)[0].tolist()
+    finally:
+        psarst_kernels.reset()
+    if psarst_kernels.jit_enabled():
+        results['compiled'] = simulate_trades(close, low, atr, sar, uptrend, 1000.0)[0].tolist()
+    for name, signals in results.items():
+        if signals != expected:
+            raise AssertionError('{} signals {} on a zero stop distance, expected {}'.format(name, signals, expected))
+    print('zero stop distance: entry skipped by the {} paths'.format(', '.join(results)))
+
+def check_streaming_parity(n_bars, seed=0):
+    """
+    Replay a synthetic history through psarst_stream and compare with the batch pipeline.
+
+    The batch side runs on reference_indicators, so the result does not
+    depend on the installed pandas_ta (see check_pandas_ta_reference).
+    """
+    data = synthetic_ohlcv(n_bars, seed)
+    batch = psarst_backtest(trend_detection(reference_indicators(data.copy())))[0]
+    stream = replay(data)
+
+    bar = first_index_difference(batch.index, stream.index)
+    if bar is not None:
+        raise AssertionError('Streaming and batch pipelines kept different bars from bar {}'.format(bar))
+    for column in ['Open', 'High', 'Low', 'Close', 'Volume', 'RSI', 'ATR', 'SuperTrend', 'SAR', 'Signal']:
+        bar = first_difference(batch[column], stream[column])
+        if bar is not None:
+            raise AssertionError('Streaming {} differs from the batch value from bar {} ({}): {} vs {}'.format(
+                column, bar, batch.index[bar].date(), stream[column].iloc[bar], batch[column].iloc[bar]))
+    print('streaming parity: {} bars match the batch pipeline'.format(len(stream)))
+
+def check_pandas_ta_reference(n_bars=5000, seed=0):
+    """indicators() with the installed pandas_ta must match reference_indicators, the behaviour the checks assume."""
+    try:
+        import pandas_ta as ta
+    except ImportError:
+        print('pandas_ta reference: skipped, pandas_ta is not installed')
+        return
+    data = synthetic_ohlcv(n_bars, seed)
+    expected = reference_indicators(data.copy())
+    actual = indicators(data.copy())
+    bar = first_index_difference(expected.index, actual.index)
+    if bar is not None:
+        raise AssertionError('pandas_ta {} keeps different bars than the reference ({}) from bar {}'.format(
+            ta.version, REFERENCE_PANDAS_TA, bar))
+    for column in ['RSI', 'ATR', 'SuperTrend']:
+        bar = first_difference(expected[column], actual[column])
+        if bar is not None:
+            raise AssertionError('pandas_ta {} {} differs from the reference ({}) from bar {}'.format(
+                ta.version, column, REFERENCE_PANDAS_TA, bar))
+    print('pandas_ta reference: pandas_ta {} matches the reference'.format(ta.version))
+
+def check_store_parity(n_bars=3000):
+    """
+    Indicators of a bar store must match the reference indicators() on each symbol's own frame.
+
+    The store holds a symbol with full history, one with suspended bars and
+    one listed later, so the union date grid has gaps for the last two.
+    """
+    source = SyntheticSource(n_bars)
+    start_date, end_date = source.date_range()
+    def gappy_source(ticker, start, end):
+        data = source(ticker, start, end)
+        if ticker == 'SUSPENDED':
+            return data.drop(data.index[[n_bars // 3, n_bars // 3 + 1, 2 * n_bars // 3]])
+        if ticker == 'LISTED':
+            return data.iloc[n_bars // 10:]
+        return data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = build_store(os.path.join(tmp, 'bars'), ['FULL', 'SUSPENDED', 'LISTED'], start_date, end_date,
+                            cache=OHLCVCache(os.path.join(tmp, 'ohlcv'), source=gappy_source))
+        block = indicator_block(store, slice(None))
+        for j, symbol in enumerate(store.symbols):
+            expected = reference_columns(store.frame(symbol))
+            missing = np.ones(len(store), dtype=bool)
+            missing[store.dates.get_indexer(expected.index)] = False
+            for column, values in block.items():
+                stored = pd.Series(values[:, j], index=store.dates)
+                bar = first_difference(expected[column], stored[expected.index])
+                if bar is not None:
+                    raise AssertionError('Store {} of {} differs from indicators() from bar {} ({})'.format(
+                        column, symbol, bar, expected.index[bar].date()))
+                if not np.isnan(stored[missing]).all():
+                    raise AssertionError('Store {} of {} has values on dates without a bar'.format(column, symbol))
+        del block, store  # Release the mapped files before the directory is removed
+    print('store parity: full, suspended and late-listed symbols match indicators()')
+
+def check_portfolio(n_bars=2000, n_symbols=6, capital=100000):
+    """
+    simulate_portfolio must keep cash non-negative and open positions within max_positions, and with
+    unconstrained cash and slots trade each symbol exactly as simulate_trades does.
+
+    The unconstrained run uses bars whose close is always above the previous
+    low, where both simulators take the same entries; position sizes differ
+    by design, so trades are compared by their entry and exit bars and prices.
+    """
+    source = SyntheticSource(n_bars)
+    start_date, end_date = source.date_range()
+    def above_low_source(ticker, start, end):
+        data = source(ticker, start, end).copy()
+        data['Low'] = np.minimum(data['Low'], data['Close'].shift(-1).fillna(np.inf) * 0.999)
+        return data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tickers = ['SYM{}'.format(i) for i in range(n_symbols)]
+        for name, data_source in [('constrained', source), ('unconstrained', above_low_source)]:
+            store = build_store(os.path.join(tmp, name), tickers, start_date, end_date,
+                                cache=OHLCVCache(os.path.join(tmp, name + '-ohlcv'), source=data_source))
+            block = indicator_block(store, slice(None))
+            arrays = [store.field('Close'), store.field('Low'), block['ATR'], block['SAR'], block['SuperTrend']]
+            first = int(np.flatnonzero(~np.isnan(np.hstack(arrays)).any(axis=1))[0])
+            close, low, atr, sar, supertrend = (np.array(values[first:]) for values in arrays)
+            del block, store, arrays  # Release the mapped files before the directory is removed
+
+            if name == 'constrained':
+                max_positions = 2
+                equity, ledger = simulate_portfolio(close, low, atr, sar, supertrend, capital=capital,
+                                                    max_positions=max_positions, max_position_fraction=0.5)
+                # Cash and open positions after each bar, rebuilt from the ledger
+                closed = ledger[ledger['exit_index'] >= 0]
+                spent = np.bincount(ledger['entry_index'], ledger['shares'] * ledger['entry_price'],
+                                    minlength=len(close))
+                received = np.bincount(closed['exit_index'], closed['shares'] * closed['exit_price'],
+                                       minlength=len(close))
+                cash = capital - np.cumsum(spent) + np.cumsum(received)
+                open_positions = (np.cumsum(np.bincount(ledger['entry_index'], minlength=len(close)))
+                                  - np.cumsum(np.bincount(closed['exit_index'], minlength=len(close))))
+                if cash.min() < -1e-6 * capital:
+                    raise AssertionError('Portfolio cash goes negative from bar {}'.format(
+                        int(np.argmax(cash < -1e-6 * capital))))
+                if open_positions.max() > max_positions:
+                    raise AssertionError('Portfolio holds more than {} positions from bar {}'.format(
+                        max_positions, int(np.argmax(open_positions > max_positions))))
+                if open_positions.max() < max_positions:
+                    raise AssertionError('Portfolio never fills its {} positions, the limit is untested'.format(
+                        max_positions))
+                continue
+
+            equity, ledger = simulate_portfolio(close, low, atr, sar, supertrend, capital=1e9, risk=1e-6,
+                                                max_positions=n_symbols, max_position_fraction=0.5 / n_symbols)
+            for j, symbol in enumerate(tickers):
+                _, expected = simulate_trades(close[:, j], low[:, j], atr[:, j], sar[:, j],
+                                              trend_flags(close[:, j], supertrend[:, j]), 1e-6 * 1e9)
+                trades = np.sort(ledger[ledger['symbol'] == j], order='entry_index')
+                for field in ['entry_index', 'exit_index', 'entry_price', 'exit_price']:
+                    if not np.array_equal(trades[field], expected[field], equal_nan=field == 'exit_price'):
+                        raise AssertionError('Portfolio {} of {} differs from simulate_trades'.format(field, symbol))
+    print('portfolio: cash and position limits hold, unconstrained trades match simulate_trades')
+
+def check_memoized_backtest(n_bars=2000):
+    """
+    memoized_backtest must return what backtest_pipeline computes, share one key for implicit and
+    explicit defaults, and miss on changed data or parameters.
+    """
+    if skip_without_pandas_ta('memoized backtest'):
+        return
+    data = synthetic_ohlcv(n_bars)
+    expected_data, expected_ledger, expected_metrics = backtest_pipeline(data.copy())
+    def same_result(what, result):
+        frame, ledger, metrics = result
+        if not (frame.equals(expected_data) and ledger.tobytes() == expected_ledger.tobytes()
+                and same_metrics(metrics, expected_metrics)):
+            raise AssertionError('memoized backtest ({}) differs from backtest_pipeline'.format(what))
+
+    with tempfile.TemporaryDirectory() as results_dir:
+        results = ResultCache(results_dir)
+        def expect_entries(what, n):
+            if len(os.listdir(results_dir)) != n:
+                raise AssertionError('memoized backtest ({}): {} stored results, expected {}'.format(
+                    what, len(os.listdir(results_dir)), n))
+
+        same_result('miss', memoized_backtest(data, results))
+        expect_entries('miss', 1)
+        same_result('memory hit', memoized_backtest(data, results))
+        same_result('explicit defaults', memoized_backtest(data, results, **BACKTEST_PARAMETERS))
+        same_result('disk hit', memoized_backtest(data, ResultCache(results_dir, max_memory_bytes=0)))
+        expect_entries('hits', 1)
+
+        changed = data.copy()
+        changed.iloc[-1, changed.columns.get_loc('Adj Close')] *= 1.01
+        memoized_backtest(changed, results)
+        expect_entries('changed data', 2)
+        memoized_backtest(data, results, target_atr=4)
+        expect_entries('changed parameters', 3)
+    print('memoized backtest: hits equal the computed result, changed inputs miss')
+
+def check_sweep(n_bars=2000):
+    """Every sweep row, the default parameters included, must carry backtest_pipeline's metrics for its parameters."""
+    if skip_without_pandas_ta('sweep'):
+        return
+    data = synthetic_ohlcv(n_bars)
+    combinations = [dict(DEFAULT_PARAMETERS), dict(DEFAULT_PARAMETERS, acceleration=0.03, st_length=7, target_atr=2)]
+    results = sweep(data, combinations, processes=1)
+    for params in combinations:
+        row = results[(results[list(params)] == pd.Series(params)).all(axis=1)]
+        _, _, metrics = backtest_pipeline(data.copy(), **params)
+        if len(row) != 1 or not same_metrics(row.iloc[0][RANK_COLUMNS].to_dict(),
+                                             {name: metrics[name] for name in RANK_COLUMNS}):
+            raise AssertionError('sweep row for {} differs from backtest_pipeline'.format(params))
+    print('sweep: rows match backtest_pipeline for default and changed parameters')
+
+def check_walk_forward(n_bars=2000):
+    """The full-history window of an expanding walk_forward must carry backtest_pipeline's metrics."""
+    if skip_without_pandas_ta('walk forward'):
+        return
+    data = synthetic_ohlcv(n_bars)
+    frame, _, metrics = backtest_pipeline(data.copy())
+    results = walk_forward(data, window=TRADING_DAYS, expanding=True, processes=1)
+    full = results.iloc[-1]
+    if full['bars'] != len(frame) or full['start_date'] != frame.index[0] or full['end_date'] != frame.index[-1]:
+        raise AssertionError('walk_forward last window covers {} bars, backtest_pipeline {}'.format(
+            full['bars'], len(frame)))
+    names = [name for name in WINDOW_COLUMNS if name in metrics]
+    if not same_metrics(full[names].to_dict(), {name: metrics[name] for name in names}):
+        raise AssertionError('walk_forward full-history window differs from backtest_pipeline')
+    print('walk forward: full-history window matches backtest_pipeline ({} windows)'.format(len(results)))
+
+def check_cache_refresh(n_bars=1000):
+    """
+    OHLCVCache must fetch only the missing head and tail, refetch re-adjusted history and evict by size.
+
+    Uses a recording source whose Adj Close can be re-adjusted, like Yahoo's after a dividend.
+    """
+    source = SyntheticSource(n_bars)
+    calls = []
+    adjustment = [1.0]
+    def recording_source(ticker, start, end):
+        calls.append((start, end))
+        data = source(ticker, start, end).copy()
+        data['Adj Close'] *= adjustment[0]
+        return data
+    def expect(what, wanted):
+        if calls != wanted:
+            raise AssertionError('{}: the source was asked for {}, expected {}'.format(what, calls, wanted))
+        calls.clear()
+    def check_bars(what, data, start, end):
+        expected = recording_source('SYM0', start, end)
+        calls.pop()
+        if not (data.index.equals(expected.index) and np.array_equal(data.to_numpy(), expected.to_numpy())):
+            raise AssertionError('{}: cached bars differ from the source'.format(what))
+
+    index = synthetic_index(n_bars)
+    start, end = index[0].to_pydatetime(), (index[-1] + pd.Timedelta(days=1)).to_pydatetime()
+    mid_start, mid_end = index[n_bars // 3].to_pydatetime(), index[2 * n_bars // 3].to_pydatetime()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = OHLCVCache(cache_dir, source=recording_source)
+        check_bars('middle window', cache.get('SYM0', mid_start, mid_end), mid_start, mid_end)
+        expect('middle window', [(mid_start, mid_end)])
+
+        # Extending both sides overlaps one completed cached bar at each end
+        data = cache.get('SYM0', start, end)
+        cached = index[n_bars // 3:2 * n_bars // 3]
+        expect('extension', [(start, cached[1].to_pydatetime()), (cached[-2].to_pydatetime(), end)])
+        check_bars('extension', data, start, end)
+        cache.get('SYM0', start, end)
+        expect('covered range', [])
+
+        # After a re-adjustment the overlapping bar differs and the whole range is fetched again
+        adjustment[0] = 0.9
+        later = end + dt.timedelta(days=7)
+        data = cache.get('SYM0', start, later)
+        expect('re-adjusted tail', [(index[-2].to_pydatetime(), later), (start, later)])
+        check_bars('re-adjusted tail', data, start, later)
+
+        # store_in_cache merges bars on the same basis and replaces re-adjusted ones
+        store_in_cache(cache, 'SYM0', recording_source('SYM0', mid_start, end), mid_start, end)
+        calls.clear()
+        if not np.array_equal(cache.load('SYM0')[0]['Adj Close'], recording_source('SYM0', start, later)['Adj Close']):
+            raise AssertionError('store_in_cache did not merge bars on the same basis')
+        adjustment[0] = 0.8
+        store_in_cache(cache, 'SYM0', recording_source('SYM0', mid_start, end), mid_start, end)
+        data, cached_start, cached_end = cache.load('SYM0')
+        if (cached_start, cached_end) != (mid_start, end):
+            raise AssertionError('store_in_cache merged re-adjusted bars into the old range')
+        calls.clear()
+
+        # Least recently used entries go first once the directory is over max_bytes
+        cache.get('SYM1', start, end)
+        os.utime(cache.path('SYM0'), (0, 0))
+        cache.max_bytes = os.path.getsize(cache.path('SYM1'))
+        cache.evict()
+        if os.path.exists(cache.path('SYM0')) or not os.path.exists(cache.path('SYM1')):
+            raise AssertionError('evict did not remove the least recently used entry')
+    print('cache refresh: head, tail, re-adjustment and eviction behave as expected')
+
+def check_bulk_download(n_tickers=20, n_bars=1000, failures=2):
+    """Bulk-download from the local chart stand-in, with injected failures, and compare with the source."""
+    source = SyntheticSource(n_bars)
+    start_date, end_date = source.date_range()
+    tickers = ['SYM{}'.format(i) for i in range(n_tickers)]
+    with ChartStandIn(source, failures=failures) as server, tempfile.TemporaryDirectory() as cache_dir:
+        cache = OHLCVCache(cache_dir, source=source)
+        summary = download(tickers, start_date, end_date, cache=cache, base_url=server.url, rate=1000, backoff=0.01)
+        if summary['error'].notna().any():
+            raise AssertionError('Bulk download failed: {}'.format(summary['error'].dropna().iloc[0]))
+        for ticker in tickers:
+            expected = source(ticker, start_date, end_date)
+            data = cache.load(ticker)[0][expected.columns]
+            if not (data.index.equals(expected.index) and np.array_equal(data.to_numpy(), expected.to_numpy())):
+                raise AssertionError('Downloaded bars for {} differ from the source'.format(ticker))
+    print('bulk download: {} tickers over {} connections, {} retries each'.format(
+        n_tickers, server.connections, failures))
+
+def check_import_time(budget_ms=IMPORT_BUDGET_MS):
+    """
+    Measure "import PSARST" in a fresh interpreter with python -X importtime.
+
+    Fails if it takes longer than budget_ms or loads any of LAZY_MODULES.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import PSARST'],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    cumulative_us = {}
+    for line in result.stderr.splitlines():
+        fields = line[len('import time:'):].split('|')
+        if line.startswith('import time:') and len(fields) == 3 and fields[1].strip().isdigit():
+            cumulative_us[fields[2].strip()] = int(fields[1])
+
+    import_ms = cumulative_us['PSARST'] / 1000
+    eager = [module for module in LAZY_MODULES if module in cumulative_us]
+    print('import PSARST: {:.0f} ms (budget {} ms)'.format(import_ms, budget_ms))
+    if eager:
+        raise AssertionError('import PSARST loads {} eagerly'.format(', '.join(eager)))
+    if import_ms > budget_ms:
+        raise AssertionError('import PSARST took {:.0f} ms, over the {} ms budget'.format(import_ms, budget_ms))
+
+def run_checks(checks):
+    """Run (name, check) pairs; a failing check is reported and the rest still run. Returns the failed names."""
+    failed = []
+    for name, check in checks:
+        try:
+            check()
+        except Exception as e:
+            print('{} FAILED: {}: {}'.format(name, type(e).__name__, e))
+            failed.append(name)
+    return failed
+
+def parse_sizes(text):
+    return [int(float(size)) for size in text.split(',')]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Offline benchmark suite for the PSARST pipeline.')
+    parser.add_argument('--bars', type=parse_sizes, default=[1000, 100000],
+                        help='Comma-separated bars per symbol, e.g. 1e3,1e5,1e7')
+    parser.add_argument('--symbols', type=parse_sizes, default=[1, 50],
+                        help='Comma-separated symbol counts, e.g. 1,50,500')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repeats (best is reported)')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline results file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='Fail when throughput drops by more than this fraction of the baseline')
+    parser.add_argument('--import-budget-ms', type=int, default=IMPORT_BUDGET_MS,
+                        help='Maximum time allowed for "import PSARST"')
+    parser.add_argument('--skip-checks', action='store_true', help='Skip the parity, download and import-time checks')
+    args = parser.parse_args()
+
+    failed_checks = []
+    if not args.skip_checks:
+        failed_checks = run_checks([
+            ('import time', lambda: check_import_time(args.import_budget_ms)),
+            ('sar parity', check_sar_parity),
+            ('kernel parity', check_kernel_parity),
+            ('simulator parity', check_simulator_parity),
+            ('zero stop distance', check_zero_stop_distance),
+            ('pandas_ta reference', check_pandas_ta_reference),
+            ('store parity', check_store_parity),
+            ('streaming parity', lambda: check_streaming_parity(5000)),
+            ('portfolio', check_portfolio),
+            ('memoized backtest', check_memoized_backtest),
+            ('sweep', check_sweep),
+            ('walk forward', check_walk_forward),
+            ('cache refresh', check_cache_refresh),
+            ('bulk download', check_bulk_download),
+        ])
+
+    results = {}
+    for n_bars in args.bars:
+        for n_symbols in args.symbols:
+            results.update(bench_cases(n_bars, n_symbols, args.repeat))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print('Baseline written to {}'.format(args.baseline))
+    elif regressions:
+        print('Throughput regressed by more than {:.0%} in: {}'.format(args.threshold, ', '.join(regressions)))
+    if failed_checks:
+        print('Failed checks: {}'.format(', '.join(failed_checks)))
+    if failed_checks or (regressions and not args.save_baseline):
+        sys.exit(1)
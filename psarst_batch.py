@@ -0,0 +1,161 @@
+import argparse
+import datetime as dt
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+
+from PSARST import extract_data, indicators, trend_detection, psarst_backtest
+from psarst_cache import CACHE_DIR, OHLCVCache, yahoo_source
+
+
+# Columns of the batch summary table, in display order
+SUMMARY_COLUMNS = ['ticker', 'start_date', 'end_date', 'bars', 'number_of_trades', 'total_return',
+                   'return_percent', 'sharpe_ratio', 'win_rate', 'max_drawdown', 'exposure', 'error']
+
+# Data shared with the worker processes of map_chunks, set once per worker
+_shared = None
+
+
+# Function to run one ticker through download -> indicators -> trend -> simulation
+def backtest_symbol(ticker, start_date, end_date, cache_dir=CACHE_DIR, source=None):
+    """
+    Backtest one ticker and return its summary row.
+
+    Failures are recorded in the row's 'error' field instead of being raised,
+    so one bad symbol does not stop a batch. Pass cache_dir=None to bypass
+    the local OHLCV cache. source replaces Yahoo Finance as the data source;
+    it must be picklable (e.g. a module-level function) to reach the workers.
+    """
+    row = {'ticker': ticker, 'start_date': start_date, 'end_date': end_date, 'error': None}
+    try:
+        if cache_dir is not None:
+            data = extract_data(ticker, start_date, end_date, cache=OHLCVCache(cache_dir, source=source or yahoo_source))
+        elif source is not None:
+            data = source(ticker, start_date, end_date)
+        else:
+            data = extract_data(ticker, start_date, end_date)
+        if len(data) == 0:
+            raise ValueError('No data returned for {}'.format(ticker))
+        data = trend_detection(indicators(data))
+        data, ledger, metrics = psarst_backtest(data)
+        row['bars'] = len(data)
+        row.update(metrics)
+    except Exception as e:
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+    return row
+
+# Function to record a job that could not run as a summary row
+def _failed_row(job, error):
+    ticker, start_date, end_date = job
+    return {'ticker': ticker, 'start_date': start_date, 'end_date': end_date,
+            'error': '{}: {}'.format(type(error).__name__, error)}
+
+def iter_batch(jobs, processes=None, cache_dir=CACHE_DIR, source=None):
+    """
+    Backtest many (ticker, start_date, end_date) jobs in a process pool.
+
+    Summary rows are yielded as soon as each job finishes, not in input order.
+    The pool defaults to one worker per CPU core. A worker process that dies
+    (e.g. killed for running out of memory) breaks the pool and every job
+    still unfinished in it; those jobs are resubmitted to a new pool. If a
+    pool breaks before any job finishes, the remaining jobs run one at a time
+    until the one that kills its worker is found: it gets an error row and
+    the rest go back to a pool.
+    """
+    pending = list(jobs)
+    processes = processes or os.cpu_count() or 1
+    one_at_a_time = False
+    while pending:
+        batch = pending[:1] if one_at_a_time else pending
+        broken = []
+        with ProcessPoolExecutor(max_workers=min(processes, len(batch))) as pool:
+            futures = {pool.submit(backtest_symbol, ticker, start_date, end_date, cache_dir, source): (ticker, start_date, end_date)
+                       for ticker, start_date, end_date in batch}
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except BrokenProcessPool as e:
+                    broken.append((futures[future], e))
+                except Exception as e:  # The job could not be sent to or returned from a worker
+                    yield _failed_row(futures[future], e)
+
+        if len(batch) == 1 and broken:  # The job kills its worker on its own
+            yield _failed_row(*broken[0])
+            broken = []
+            one_at_a_time = False
+        elif broken and len(broken) == len(batch):
+            one_at_a_time = True  # No job finished, so nothing tells which one killed the worker
+        pending = [job for job, _ in broken] + pending[len(batch):]
+
+def run_batch(jobs, processes=None, cache_dir=CACHE_DIR, on_result=None, source=None):
+    """
+    Backtest many jobs and return the summary table.
+
+    on_result, if given, is called with each row as it arrives.
+    """
+    rows = []
+    for row in iter_batch(jobs, processes=processes, cache_dir=cache_dir, source=source):
+        if on_result is not None:
+            on_result(row)
+        rows.append(row)
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+def _init_shared(shared):
+    global _shared
+    _shared = shared
+
+def _run_chunk(func, chunk, args):
+    return func(_shared, chunk, *args)
+
+def map_chunks(func, items, shared, args=(), processes=None, chunk_size=50):
+    """
+    Call func(shared, chunk, *args) on chunks of items across a process pool and return all rows.
+
+    shared (e.g. precomputed indicator arrays) reaches each worker once, when
+    it starts, instead of with every chunk. func must be a module-level
+    function returning a list of rows; rows are collected in completion
+    order. With processes=1 or a single chunk everything runs in this process.
+    """
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    processes = processes or os.cpu_count() or 1
+
+    rows = []
+    if processes == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            rows.extend(func(shared, chunk, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(chunks)), initializer=_init_shared,
+                                 initargs=(shared,)) as pool:
+            futures = [pool.submit(_run_chunk, func, chunk, args) for chunk in chunks]
+            for future in as_completed(futures):
+                rows.extend(future.result())
+    return rows
+
+# Function to print one summary row as it streams in
+def print_row(row):
+    if row['error'] is not None:
+        print('{:<16} FAILED  {}'.format(row['ticker'], row['error']))
+    else:
+        print('{:<16} trades={:<4} return={:.2f}% sharpe={:.3f} win_rate={:.1f}%'.format(
+            row['ticker'], row['number_of_trades'], row['return_percent'], row['sharpe_ratio'],
+            row['win_rate'] * 100))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Backtest PSARST on many symbols in parallel.')
+    parser.add_argument('symbols', nargs='+', help='Symbols to backtest, e.g. TATASTEEL INFY')
+    parser.add_argument('--years', type=int, default=10, help='Number of years of history')
+    parser.add_argument('--suffix', default='.NS', help='Exchange suffix appended to each symbol')
+    parser.add_argument('--processes', type=int, default=None, help='Worker processes (default: CPU cores)')
+    parser.add_argument('--no-cache', action='store_true', help='Always download fresh data')
+    parser.add_argument('--output', help='Write the summary table to this CSV file')
+    args = parser.parse_args()
+
+    end_date = dt.datetime.now()
+    start_date = end_date - dt.timedelta(days=365 * args.years)
+    jobs = [(symbol + args.suffix, start_date, end_date) for symbol in args.symbols]
+
+    summary = run_batch(jobs, processes=args.processes, cache_dir=None if args.no_cache else CACHE_DIR,
+                        on_result=print_row)
+    if args.output:
+        summary.to_csv(args.output, index=False)
@@ -0,0 +1,184 @@
+import datetime as dt
+import os
+import pickle
+import re
+import time
+import numpy as np
+import pandas as pd
+
+
+# Configuration Constants
+CACHE_DIR = os.path.join("cache", "ohlcv")
+MAX_CACHE_BYTES = 512 * 1024 * 1024  # Total size kept on disk
+MAX_CACHE_AGE = dt.timedelta(days=30)  # Entries unused for longer are evicted
+REFRESH_INTERVAL = dt.timedelta(hours=1)  # Shorter missing tails are served from disk
+
+# Errors of unreadable cache files: truncated, corrupt, or pickled by other library versions
+LOAD_ERRORS = (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError,
+               ValueError, KeyError)
+
+
+# Function to replace a cache file atomically, so readers never see a partial file
+def write_atomic(path, blob):
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())  # Unique per process for parallel runs
+    with open(tmp_path, "wb") as f:
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+# Function to read a cache file and mark it as recently used for evict_lru
+def read_recent(path):
+    with open(path, "rb") as f:
+        blob = f.read()
+    os.utime(path)
+    return blob
+
+def evict_lru(cache_dir, max_bytes, max_age=None, suffix=".pkl"):
+    """
+    Delete cache files in cache_dir, least recently used (oldest mtime) first.
+
+    Files unused for longer than max_age (a timedelta) always go; then more
+    go until the files ending in suffix take at most max_bytes.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(suffix):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:  # Removed by another process
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    oldest_allowed = time.time() - max_age.total_seconds() if max_age is not None else float("-inf")
+    total_bytes = sum(size for _, size, _ in entries)
+    for mtime, size, path in sorted(entries):
+        if mtime >= oldest_allowed and total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+
+def clear_dir(cache_dir, suffix=".pkl"):
+    for name in os.listdir(cache_dir):
+        if name.endswith(suffix):
+            os.remove(os.path.join(cache_dir, name))
+
+# Default data source: daily bars from Yahoo Finance
+def yahoo_source(ticker, start_date, end_date):
+    import yfinance as yf
+    return yf.download(ticker, start=start_date, end=end_date, progress=False)
+
+class OHLCVCache:
+    """
+    Persistent per-ticker OHLCV store in front of a data source.
+
+    Each ticker is one pickle file holding the bars and the date range they
+    cover. get() serves the cached range and only asks the source for the
+    part that is missing (an older head or a newer tail). Files are evicted
+    when unused for longer than max_age or when the cache grows past
+    max_bytes, least recently used first.
+
+    source is any callable (ticker, start_date, end_date) -> DataFrame, so a
+    local fake can be injected for offline use.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, source=yahoo_source, max_bytes=MAX_CACHE_BYTES,
+                 max_age=MAX_CACHE_AGE, refresh_interval=REFRESH_INTERVAL):
+        self.cache_dir = cache_dir
+        self.source = source
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, ticker):
+        return os.path.join(self.cache_dir, re.sub(r'[^A-Za-z0-9_.^&-]', '_', ticker) + ".pkl")
+
+    def load(self, ticker):
+        """Return (data, start_date, end_date) for a cached ticker, or None."""
+        try:
+            entry = pickle.loads(read_recent(self.path(ticker)))
+            return entry["data"], entry["start"], entry["end"]
+        except LOAD_ERRORS:  # Treated as a miss; the next store() overwrites the file
+            return None
+
+    def store(self, ticker, data, start_date, end_date):
+        entry = {"data": data, "start": start_date, "end": end_date}
+        write_atomic(self.path(ticker), pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        self.evict()
+
+    def get(self, ticker, start_date, end_date):
+        """Return bars for ticker in [start_date, end_date), fetching only what is missing."""
+        cached = self.load(ticker)
+        if cached is None:
+            data = self.source(ticker, start_date, end_date)
+            if len(data) > 0:
+                self.store(ticker, data, start_date, end_date)
+            return data
+
+        data, cached_start, cached_end = cached
+        changed = False
+
+        # Older history than we have on disk, overlapping the first cached bar to check that the
+        # history has not been re-adjusted (dividends, splits) since it was cached
+        if start_date < cached_start:
+            head_end = data.index[1].to_pydatetime() if len(data) > 1 else cached_start
+            head = self.source(ticker, start_date, head_end)
+            if self.readjusted(data, head):
+                data = self.source(ticker, start_date, cached_end)
+            else:
+                data = self.merge(head, data)
+            cached_start = start_date
+            changed = True
+
+        # Newer bars; the last cached bar is fetched again in case it was still forming, and the
+        # one before it for the same re-adjustment check
+        if end_date - cached_end > self.refresh_interval:
+            tail_start = data.index[max(len(data) - 2, 0)].to_pydatetime() if len(data) > 0 else cached_end
+            tail = self.source(ticker, tail_start, end_date)
+            if self.readjusted(data, tail):
+                data = self.source(ticker, cached_start, end_date)
+            else:
+                data = self.merge(data, tail)
+            cached_end = end_date
+            changed = True
+
+        if changed:
+            self.store(ticker, data, cached_start, cached_end)
+
+        start = pd.Timestamp(start_date).normalize()
+        return data[(data.index >= start) & (data.index < pd.Timestamp(end_date))]
+
+    @staticmethod
+    def readjusted(cached, fresh):
+        """
+        True when fresh bars disagree with cached ones on a completed bar both contain.
+
+        Yahoo re-adjusts the whole price history after a dividend or split, so
+        cached bars on the old basis must not be merged with fresh ones. The
+        last cached bar is not compared, as it may have been fetched while
+        still forming.
+        """
+        columns = [name for name in ("Close", "Adj Close") if name in cached.columns and name in fresh.columns]
+        shared = cached.index[:-1].intersection(fresh.index)
+        if len(shared) == 0 or not columns:
+            return False
+        old = cached.loc[shared, columns].to_numpy(dtype=np.float64)
+        new = fresh.loc[shared, columns].to_numpy(dtype=np.float64)
+        return not np.allclose(old, new, rtol=1e-6, atol=0, equal_nan=True)
+
+    @staticmethod
+    def merge(older, newer):
+        # Newer rows win where the two overlap
+        data = pd.concat([older, newer])
+        return data[~data.index.duplicated(keep="last")].sort_index()
+
+    def evict(self):
+        """Delete entries older than max_age, then least recently used ones until under max_bytes."""
+        evict_lru(self.cache_dir, self.max_bytes, self.max_age)
+
+    def clear(self):
+        clear_dir(self.cache_dir)
@@ -0,0 +1,68 @@
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+from multiprocessing.connection import Client
+
+# Client side of the warm worker (psarst_worker.py). Only the standard library is imported here, so
+# runner.py can use it without the frozen launcher bundling PSARST and its libraries
+
+
+# State file of a running worker: its address and the key clients authenticate with
+STATE_FILE = '.psarst_worker'
+START_TIMEOUT = 120  # Seconds to wait for a new worker to import everything and listen
+WORKER_SCRIPT = 'psarst_worker.py'  # Relative to the working directory, like runner.SCRIPT_PATH
+
+
+def connect(state_file=STATE_FILE):
+    """Connect to the running worker, or return None if there is none."""
+    try:
+        with open(state_file) as f:
+            state = json.load(f)
+        return Client(tuple(state['address']), authkey=bytes.fromhex(state['authkey']))
+    except (FileNotFoundError, ValueError, KeyError, OSError):
+        return None
+
+def start_worker(python=sys.executable, state_file=STATE_FILE, log_file=None, timeout=START_TIMEOUT,
+                 script=WORKER_SCRIPT):
+    """
+    Start a worker in the background with the given interpreter and wait until it accepts jobs.
+
+    The worker runs as "python psarst_worker.py serve" in the current working
+    directory, the way runner.py runs PSARST.py, so this also works from the
+    frozen launcher. Returns a connection to it. The worker outlives the
+    calling process.
+    """
+    if not os.path.exists(script):
+        raise RuntimeError('{} not found in {}'.format(script, os.getcwd()))
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(state_file)  # Left behind by a worker that died
+    log = open(log_file, 'ab') if log_file else subprocess.DEVNULL
+    process = subprocess.Popen([str(python), script, 'serve', '--state-file', os.path.abspath(state_file)],
+                               stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = connect(state_file)
+        if connection is not None:
+            return connection
+        if process.poll() is not None:
+            raise RuntimeError('The worker exited with code {}'.format(process.returncode))
+        time.sleep(0.1)
+    raise TimeoutError('The worker did not start within {} seconds'.format(timeout))
+
+def submit(connection, symbol, years, suffix='.NS', plot=True, plot_file=None):
+    """Run one job on the worker and return its reply ({'ok', 'output', 'error'})."""
+    connection.send({'symbol': symbol, 'years': years, 'suffix': suffix, 'plot': plot, 'plot_file': plot_file})
+    return connection.recv()
+
+def stop_worker(state_file=STATE_FILE):
+    """Ask the running worker to exit; returns False if none was running."""
+    connection = connect(state_file)
+    if connection is None:
+        return False
+    with connection:
+        connection.send({'command': 'shutdown'})
+        connection.recv()
+    return True
@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import calendar
+import datetime as dt
+import http.client
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+import numpy as np
+import pandas as pd
+
+from psarst_cache import OHLCVCache
+
+
+# Yahoo Finance chart API and download defaults
+YAHOO_CHART_URL = 'https://query1.finance.yahoo.com'
+CHART_PATH = '/v8/finance/chart/'
+USER_AGENT = 'Mozilla/5.0 (PSARST bulk downloader)'
+CONCURRENCY = 8  # Requests in flight at once
+RATE_LIMIT = 5.0  # Requests started per second
+RETRIES = 4  # Extra attempts after a transient failure
+BACKOFF = 0.5  # First retry delay in seconds, doubled on every attempt
+MAX_BACKOFF = 30.0
+TIMEOUT = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Columns of a downloaded frame, as yfinance returns them
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+class DownloadError(Exception):
+    """A ticker could not be downloaded; retryable errors may succeed on a later attempt."""
+
+    def __init__(self, message, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+# Function to turn a (naive, UTC) date into the epoch seconds the chart API expects
+def _epoch(date):
+    return calendar.timegm(pd.Timestamp(date).timetuple())
+
+def chart_path(ticker, start_date, end_date):
+    query = urlencode({'period1': _epoch(start_date), 'period2': _epoch(end_date), 'interval': '1d',
+                       'events': 'div,splits', 'includeAdjustedClose': 'true'})
+    return CHART_PATH + quote(ticker, safe='') + '?' + query
+
+def parse_chart(payload):
+    """
+    Turn a Yahoo chart API response into an OHLCV frame like yf.download returns.
+
+    Bars are dated by the exchange's local trading day. Bars with no prices
+    at all are dropped.
+    """
+    chart = payload.get('chart') or {}
+    if chart.get('error'):
+        raise DownloadError('{code}: {description}'.format(**chart['error']))
+    result = (chart.get('result') or [None])[0]
+    if result is None or not result.get('timestamp'):
+        return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name='Date'), dtype=np.float64)
+
+    offset = result['meta'].get('gmtoffset') or 0
+    dates = pd.to_datetime(np.asarray(result['timestamp'], dtype=np.int64) + offset, unit='s').normalize()
+    quote_ = result['indicators']['quote'][0]
+    adjclose = (result['indicators'].get('adjclose') or [{}])[0].get('adjclose') or quote_['close']
+    columns = {'Open': quote_['open'], 'High': quote_['high'], 'Low': quote_['low'], 'Close': quote_['close'],
+               'Adj Close': adjclose, 'Volume': quote_['volume']}
+    data = pd.DataFrame({name: np.array(values, dtype=np.float64) for name, values in columns.items()},
+                        index=pd.DatetimeIndex(dates, name='Date'))
+    data = data.dropna(how='all', subset=['Open', 'High', 'Low', 'Close'])
+    return data[~data.index.duplicated(keep='last')]
+
+class BulkDownloader:
+    """
+    Download daily bars for many tickers concurrently from a chart API.
+
+    At most concurrency requests are in flight and at most rate requests start
+    per second. Transient failures (connection errors, 429 and 5xx answers)
+    are retried up to retries times with exponential backoff and jitter,
+    honouring Retry-After. HTTP connections are kept alive and reused; the
+    blocking http.client calls run in a thread pool.
+
+    base_url can point at a ChartStandIn for offline use.
+    """
+
+    def __init__(self, base_url=YAHOO_CHART_URL, concurrency=CONCURRENCY, rate=RATE_LIMIT, retries=RETRIES,
+                 backoff=BACKOFF, max_backoff=MAX_BACKOFF, timeout=TIMEOUT):
+        url = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.host, self.port = url.hostname, url.port
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._idle = []  # Open connections not currently in use
+        self._idle_lock = threading.Lock()
+
+    def _connection(self):
+        with self._idle_lock:
+            if self._idle:
+                return self._idle.pop()
+        return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, connection):
+        with self._idle_lock:
+            self._idle.append(connection)
+
+    def close(self):
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def request(self, path):
+        """Blocking GET of path on a pooled connection; returns the decoded JSON body."""
+        connection = self._connection()
+        try:
+            connection.request('GET', path, headers={'User-Agent': USER_AGENT, 'Accept': 'application/json'})
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()  # The connection may be half-used; never reuse it
+            raise DownloadError('{}: {}'.format(type(e).__name__, e), retryable=True)
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+        if response.status != 200:
+            retry_after = response.getheader('Retry-After')
+            raise DownloadError('HTTP {} {}'.format(response.status, response.reason),
+                                retryable=response.status in RETRY_STATUSES,
+                                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None)
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise DownloadError('Invalid JSON: {}'.format(e), retryable=True)
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (1-based)."""
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        delay += random.uniform(0, delay)  # Jitter, so failed requests do not retry in lockstep
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def _throttle(self):
+        async with self._rate_lock:
+            now = time.monotonic()
+            if self._next_start > now:
+                await asyncio.sleep(self._next_start - now)
+            self._next_start = max(now, self._next_start) + 1.0 / self.rate
+
+    async def fetch(self, ticker, start_date, end_date):
+        """Download one ticker; returns (data, attempts) or raises DownloadError."""
+        loop = asyncio.get_running_loop()
+        path = chart_path(ticker, start_date, end_date)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self._semaphore:
+                    await self._throttle()
+                    payload = await loop.run_in_executor(self._executor, self.request, path)
+                return parse_chart(payload), attempt
+            except DownloadError as e:
+                if not e.retryable or attempt > self.retries:
+                    e.attempts = attempt
+                    raise
+                await asyncio.sleep(self.delay(attempt, e.retry_after))
+
+    async def fetch_many(self, tickers, start_date, end_date, on_data=None):
+        """
+        Download all tickers and return one summary row per ticker, in input order.
+
+        on_data(ticker, data), if given, is called with every downloaded frame
+        (in a worker thread, so it may block). Failures are recorded in the
+        row's 'error' field instead of being raised.
+        """
+        self._semaphore = asyncio.BoundedSemaphore(self.concurrency)
+        self._rate_lock = asyncio.Lock()
+        self._next_start = 0.0
+        loop = asyncio.get_running_loop()
+
+        async def one(ticker):
+            row = {'ticker': ticker, 'bars': 0, 'attempts': 0, 'error': None}
+            try:
+                data, row['attempts'] = await self.fetch(ticker, start_date, end_date)
+                row['bars'] = len(data)
+                if on_data is not None:
+                    await loop.run_in_executor(self._executor, on_data, ticker, data)
+            except Exception as e:
+                row['attempts'] = getattr(e, 'attempts', row['attempts'])
+                row['error'] = '{}: {}'.format(type(e).__name__, e)
+            return row
+
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            return await asyncio.gather(*(one(ticker) for ticker in tickers))
+        finally:
+            self._executor.shutdown()
+            self.close()
+
+# Function to write downloaded bars into the cache, merged with an overlapping cached range
+def store_in_cache(cache, ticker, data, start_date, end_date):
+    if len(data) == 0:
+        return
+    cached = cache.load(ticker)
+    if cached is not None:
+        cached_data, cached_start, cached_end = cached
+        # Cached bars on an older adjustment basis are replaced rather than merged
+        if cached_start <= end_date and start_date <= cached_end and not cache.readjusted(cached_data, data):
+            data = cache.merge(cached_data, data)
+            start_date, end_date = min(start_date, cached_start), max(end_date, cached_end)
+    cache.store(ticker, data, start_date, end_date)
+
+def download(tickers, start_date, end_date, cache=None, on_result=None, **options):
+    """
+    Bulk-download tickers into the OHLCV cache and return a summary table.
+
+    Tickers the cache already covers for [start_date, end_date) are skipped.
+    options are passed to BulkDownloader (base_url, concurrency, rate, ...).
+    """
+    cache = cache if cache is not None else OHLCVCache()
+    missing, rows = [], []
+    for ticker in tickers:
+        cached = cache.load(ticker)
+        if cached is not None and cached[1] <= start_date and end_date - cached[2] <= cache.refresh_interval:
+            rows.append({'ticker': ticker, 'bars': None, 'attempts': 0, 'error': None})
+        else:
+            missing.append(ticker)
+
+    def on_data(ticker, data):
+        store_in_cache(cache, ticker, data, start_date, end_date)
+
+    downloader = BulkDownloader(**options)
+    rows += asyncio.run(downloader.fetch_many(missing, start_date, end_date, on_data=on_data))
+    if on_result is not None:
+        for row in rows:
+            on_result(row)
+    return pd.DataFrame(rows, columns=['ticker', 'bars', 'attempts', 'error'])
+
+class ChartStandIn:
+    """
+    Local HTTP server answering chart API requests with canned Yahoo-style responses.
+
+    Bars come from source(ticker, start_date, end_date), e.g. a synthetic data
+    source. failures makes the first N requests of every ticker fail with
+    failure_status, latency delays every answer. Use as a context manager;
+    url is the base_url to give BulkDownloader.
+    """
+
+    def __init__(self, source, failures=0, failure_status=503, latency=0.0, gmtoffset=19800):
+        self.source = source
+        self.failures = failures
+        self.failure_status = failure_status
+        self.latency = latency
+        self.gmtoffset = gmtoffset  # Seconds east of UTC of the pretend exchange (19800 = IST)
+        self.requests = {}  # Requests received per ticker
+        self.connections = 0  # TCP connections accepted
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def chart(self, ticker, start_date, end_date):
+        data = self.source(ticker, start_date, end_date)
+        # Bars are stamped at 09:15 exchange time, as Yahoo does for NSE
+        timestamps = (data.index.normalize().asi8 // 10 ** 9 + 9 * 3600 + 15 * 60 - self.gmtoffset).tolist()
+        def values(column):
+            return [None if v != v else v for v in data[column].tolist()]
+        return {'chart': {'result': [{
+            'meta': {'symbol': ticker, 'gmtoffset': self.gmtoffset, 'dataGranularity': '1d'},
+            'timestamp': timestamps,
+            'indicators': {
+                'quote': [{'open': values('Open'), 'high': values('High'), 'low': values('Low'),
+                           'close': values('Close'), 'volume': values('Volume')}],
+                'adjclose': [{'adjclose': values('Adj Close')}],
+            },
+        }], 'error': None}}
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, so clients can reuse connections
+
+            def setup(self):
+                super().setup()
+                with stand_in._lock:
+                    stand_in.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status, payload, headers=()):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if not url.path.startswith(CHART_PATH):
+                    return self.send_json(404, {'chart': {'result': None, 'error': {
+                        'code': 'Not Found', 'description': 'No such endpoint'}}})
+                ticker = unquote(url.path[len(CHART_PATH):])
+                query = parse_qs(url.query)
+                with stand_in._lock:
+                    count = stand_in.requests[ticker] = stand_in.requests.get(ticker, 0) + 1
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                if count <= stand_in.failures:
+                    return self.send_json(stand_in.failure_status, {'chart': {'result': None, 'error': {
+                        'code': 'Unavailable', 'description': 'Injected failure'}}}, [('Retry-After', '0')])
+
+                start_date, end_date = (dt.datetime.fromtimestamp(int(query[name][0]), dt.timezone.utc)
+                                        .replace(tzinfo=None) for name in ['period1', 'period2'])
+                self.send_json(200, stand_in.chart(ticker, start_date, end_date))
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+# Function to print one download summary row
+def print_row(row):
+    if row['error'] is not None:
+        print('{:<16} FAILED  {}'.format(row['ticker'], row['error']))
+    elif row['bars'] is None:
+        print('{:<16} cached'.format(row['ticker']))
+    else:
+        print('{:<16} bars={:<6} attempts={}'.format(row['ticker'], row['bars'], row['attempts']))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Download daily bars for many symbols into the local cache.')
+    parser.add_argument('symbols', nargs='+', help='Symbols to download, e.g. TATASTEEL INFY')
+    parser.add_argument('--years', type=int, default=10, help='Number of years of history')
+    parser.add_argument('--suffix', default='.NS', help='Exchange suffix appended to each symbol')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='Requests in flight at once')
+    parser.add_argument('--rate', type=float, default=RATE_LIMIT, help='Requests started per second')
+    parser.add_argument('--retries', type=int, default=RETRIES, help='Retries after a transient failure')
+    parser.add_argument('--base-url', default=YAHOO_CHART_URL, help='Chart API server')
+    parser.add_argument('--store', help='Also build a memory-mapped bar store in this directory')
+    args = parser.parse_args()
+
+    end_date = dt.datetime.now()
+    start_date = end_date - dt.timedelta(days=365 * args.years)
+    tickers = [symbol + args.suffix for symbol in args.symbols]
+    cache = OHLCVCache()
+    summary = download(tickers, start_date, end_date, cache=cache, on_result=print_row, base_url=args.base_url,
+                       concurrency=args.concurrency, rate=args.rate, retries=args.retries)
+    if args.store:
+        from psarst_store import build_store
+        ok = summary.loc[summary['error'].isna(), 'ticker'].tolist()
+        store = build_store(args.store, ok, start_date, end_date, cache=cache)
+        print('Stored {} symbols x {} dates in {}'.format(len(store.symbols), len(store), args.store))
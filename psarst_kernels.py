@@ -0,0 +1,47 @@
+import os
+
+
+# Set PSARST_NO_JIT=1 to run the pure-Python kernels even when numba is installed
+NO_JIT_ENV = 'PSARST_NO_JIT'
+
+_numba = None  # The numba module, False when unavailable or disabled, None until first checked
+_compiled = {}
+
+
+def jit_enabled():
+    """True when numba is installed and not disabled through PSARST_NO_JIT."""
+    global _numba
+    if _numba is None:
+        _numba = False
+        if os.environ.get(NO_JIT_ENV, '') in ('', '0'):
+            try:
+                import numba
+                _numba = numba
+            except ImportError:
+                pass
+    return _numba is not False
+
+def compiled(func):
+    """
+    Return func compiled with numba.njit, or None when the JIT is not available.
+
+    Compilation happens on the first call with a given set of argument types
+    and is cached on disk (in __pycache__), so later launches load the
+    machine code instead of compiling again. func must be written so that it
+    also runs as plain Python; that is the fallback.
+    """
+    if not jit_enabled():
+        return None
+    if func not in _compiled:
+        _compiled[func] = _numba.njit(cache=True, nogil=True)(func)
+    return _compiled[func]
+
+def disable():
+    """Use the pure-Python kernels from now on, e.g. to compare both paths."""
+    global _numba
+    _numba = False
+
+def reset():
+    """Forget disable() and check the environment and numba again."""
+    global _numba
+    _numba = None
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+import numpy as np
+
+from psarst_cache import LOAD_ERRORS, clear_dir, evict_lru, read_recent, write_atomic
+
+
+# Configuration Constants
+RESULTS_DIR = os.path.join("cache", "results")
+MAX_MEMORY_BYTES = 128 * 1024 * 1024  # Results kept in memory, as pickled bytes
+MAX_DISK_BYTES = 1024 * 1024 * 1024  # Results kept on disk
+
+# Source files whose contents change results, and libraries whose versions do
+CODE_FILES = ['PSARST.py', 'psarst_kernels.py']
+CODE_PACKAGES = ['numpy', 'pandas', 'pandas_ta']
+
+_code_version = None
+
+
+def code_version():
+    """Hash of the pipeline's source files and library versions; changes whenever results may change."""
+    global _code_version
+    if _code_version is None:
+        import importlib.metadata
+
+        digest = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in CODE_FILES:
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        for package in CODE_PACKAGES:
+            try:
+                version = importlib.metadata.version(package)
+            except importlib.metadata.PackageNotFoundError:
+                version = None
+            digest.update('{}={}'.format(package, version).encode())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+def fingerprint(data, **params):
+    """
+    Content address of a computation on an OHLCV frame.
+
+    Covers the frame's index and columns (names, dtypes and values), every
+    parameter and the code version, so changed data, parameters or code
+    always give a new key.
+    """
+    digest = hashlib.sha256(code_version().encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    def update(name, values):
+        values = np.ascontiguousarray(values)
+        digest.update('{}:{}:{}'.format(name, values.dtype, values.shape).encode())
+        digest.update(values.tobytes() if values.dtype != object else pickle.dumps(values))
+
+    update('index', data.index.to_numpy())
+    for column in data.columns:
+        update(column, data[column].to_numpy())
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Two-level least-recently-used cache of computation results by content key.
+
+    Results are pickled once on put(). The bytes are kept in memory up to
+    max_memory_bytes and in one file per key on disk up to max_disk_bytes,
+    so every get() returns a fresh copy that the caller may modify. Stale
+    entries are never looked up again (their key changes with the data or the
+    code) and age out of both levels.
+    """
+
+    def __init__(self, cache_dir=RESULTS_DIR, max_memory_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()  # key -> pickled result, least recently used first
+        self._memory_bytes = 0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def _remember(self, key, blob):
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        if len(blob) > self.max_memory_bytes:
+            return
+        self._memory[key] = blob
+        self._memory_bytes += len(blob)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def get(self, key, default=None):
+        blob = self._memory.get(key)
+        if blob is not None:
+            self._memory.move_to_end(key)
+            return pickle.loads(blob)
+        if self.cache_dir is None:
+            return default
+
+        try:
+            blob = read_recent(self.path(key))
+            result = pickle.loads(blob)
+        except LOAD_ERRORS:
+            return default
+        self._remember(key, blob)
+        return result
+
+    def put(self, key, result):
+        blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, blob)
+        if self.cache_dir is not None:
+            write_atomic(self.path(key), blob)
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used result files until the directory is under max_disk_bytes."""
+        evict_lru(self.cache_dir, self.max_disk_bytes)
+
+    def clear(self):
+        self._memory.clear()
+        self._memory_bytes = 0
+        if self.cache_dir is not None:
+            clear_dir(self.cache_dir)
+
+    def memoize(self, key, compute):
+        """Return the cached result for key, or compute() it, store it and return it."""
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
@@ -0,0 +1,171 @@
+import argparse
+import datetime as dt
+import itertools
+import random
+import numpy as np
+import pandas as pd
+
+from PSARST import calculate_sar, equity_curve, extract_data, simulate_trades, trade_metrics, trend_flags
+from psarst_batch import map_chunks
+from psarst_cache import OHLCVCache
+
+
+# Strategy parameters used by the script, and the grid searched by default
+DEFAULT_PARAMETERS = {
+    'acceleration': 0.02,
+    'max_acceleration': 0.2,
+    'st_length': 10,
+    'st_multiplier': 3,
+    'atr_length': 14,
+    'target_atr': 3,
+    'risk': 0.01,
+}
+PARAMETER_GRID = {
+    'acceleration': [0.01, 0.02, 0.03],
+    'max_acceleration': [0.1, 0.2, 0.3],
+    'st_length': [7, 10, 14],
+    'st_multiplier': [2, 3, 4],
+    'atr_length': [10, 14, 20],
+    'target_atr': [2, 3, 4],
+    'risk': [0.01],
+}
+RANK_COLUMNS = ['sharpe_ratio', 'win_rate', 'max_drawdown', 'return_percent', 'number_of_trades', 'exposure']
+
+
+class IndicatorCache:
+    """
+    Compute each distinct indicator series once and share it across combinations.
+
+    Series are computed exactly as in PSARST.indicators (same pandas_ta calls
+    on the same inputs), keyed by the parameters they depend on, e.g. one
+    SuperTrend per (length, multiplier).
+    """
+
+    def __init__(self, data, rsi_length=14):
+        import pandas_ta as ta
+
+        self.data = data
+        self.base = {
+            'Open': data['Open'].to_numpy(dtype=np.float64),
+            'High': data['High'].to_numpy(dtype=np.float64),
+            'Low': data['Low'].to_numpy(dtype=np.float64),
+            'Close': data['Adj Close'].to_numpy(dtype=np.float64),
+            'Volume': data['Volume'].to_numpy(dtype=np.float64),
+            'RSI': ta.rsi(data['Adj Close'], length=rsi_length).to_numpy(dtype=np.float64),
+        }
+        self.series = {}
+
+    def get(self, key):
+        if key not in self.series:
+            import pandas_ta as ta
+
+            name = key[0]
+            if name == 'ATR':
+                atr = ta.atr(self.data['High'], self.data['Low'], self.data['Adj Close'], length=key[1])
+                self.series[key] = atr.to_numpy(dtype=np.float64)
+            elif name == 'SuperTrend':
+                st = ta.supertrend(self.data['High'], self.data['Low'], self.data['Adj Close'],
+                                   length=key[1], multiplier=key[2])
+                self.series[key] = st.iloc[:, 0].to_numpy(dtype=np.float64)
+            elif name == 'SAR':
+                self.series[key] = calculate_sar(self.data['High'], self.data['Low'], acceleration=key[1],
+                                                 max_acceleration=key[2]).to_numpy(dtype=np.float64)
+        return self.series[key]
+
+    def prepare(self, combinations):
+        """Compute every series needed by the combinations and return them with the base columns."""
+        for params in combinations:
+            for key in indicator_keys(params):
+                self.get(key)
+        columns = dict(self.base)
+        columns.update(self.series)
+        return columns
+
+# Function to list the cached series a parameter combination depends on
+def indicator_keys(params):
+    return [('ATR', params['atr_length']),
+            ('SuperTrend', params['st_length'], params['st_multiplier']),
+            ('SAR', params['acceleration'], params['max_acceleration'])]
+
+def evaluate(columns, params, capital=100000):
+    """
+    Backtest one parameter combination on precomputed indicator arrays.
+
+    Mirrors indicators() -> trend_detection() -> psarst_backtest(): rows with
+    any missing value are dropped, then the trend and trades are simulated.
+    """
+    atr_key, st_key, sar_key = indicator_keys(params)
+    atr, supertrend, sar = columns[atr_key], columns[st_key], columns[sar_key]
+    close, low = columns['Close'], columns['Low']
+
+    valid = ~(np.isnan(columns['Open']) | np.isnan(columns['High']) | np.isnan(low) | np.isnan(close) |
+              np.isnan(columns['Volume']) | np.isnan(columns['RSI']) | np.isnan(atr) |
+              np.isnan(supertrend) | np.isnan(sar))
+    rows = np.flatnonzero(valid)
+    close, low, atr, supertrend, sar = close[rows], low[rows], atr[rows], supertrend[rows], sar[rows]
+
+    signals, ledger = simulate_trades(
+        close, low, atr, sar, trend_flags(close, supertrend),
+        params['risk'] * capital, params['target_atr'])
+    return trade_metrics(ledger, equity_curve(close, ledger, capital), capital)
+
+def grid_combinations(grid=PARAMETER_GRID):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def random_combinations(n, grid=PARAMETER_GRID, seed=0):
+    """Draw n distinct combinations from the grid (all of them if the grid is smaller)."""
+    combinations = grid_combinations(grid)
+    if n >= len(combinations):
+        return combinations
+    return random.Random(seed).sample(combinations, n)
+
+def _evaluate_chunk(columns, chunk, capital):
+    rows = []
+    for params in chunk:
+        metrics = evaluate(columns, params, capital)
+        rows.append(dict(params, **metrics))
+    return rows
+
+def sweep(data, combinations, processes=None, capital=100000, chunk_size=50):
+    """
+    Evaluate parameter combinations on one symbol and return them ranked by Sharpe ratio.
+
+    data is a raw OHLCV frame as returned by extract_data. Indicator series
+    are computed once per distinct parameter set in this process, then the
+    combinations are evaluated in chunks across a process pool.
+    """
+    columns = IndicatorCache(data).prepare(combinations)
+    rows = map_chunks(_evaluate_chunk, combinations, columns, args=(capital,), processes=processes,
+                      chunk_size=chunk_size)
+
+    results = pd.DataFrame(rows, columns=list(combinations[0]) + RANK_COLUMNS if combinations else RANK_COLUMNS)
+    return results.sort_values(['sharpe_ratio', 'win_rate', 'max_drawdown'], ascending=False,
+                               na_position='last', ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Search PSARST strategy parameters on one symbol.')
+    parser.add_argument('symbol', help='Symbol to optimise, e.g. TATASTEEL')
+    parser.add_argument('--years', type=int, default=10, help='Number of years of history')
+    parser.add_argument('--suffix', default='.NS', help='Exchange suffix appended to the symbol')
+    parser.add_argument('--random', type=int, default=None, help='Evaluate this many random combinations '
+                                                                 'instead of the full grid')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for --random')
+    parser.add_argument('--processes', type=int, default=None, help='Worker processes (default: CPU cores)')
+    parser.add_argument('--top', type=int, default=20, help='Number of ranked rows to print')
+    parser.add_argument('--output', help='Write the full ranked table to this CSV file')
+    args = parser.parse_args()
+
+    end_date = dt.datetime.now()
+    start_date = end_date - dt.timedelta(days=365 * args.years)
+    data = extract_data(args.symbol + args.suffix, start_date, end_date, cache=OHLCVCache())
+
+    if args.random is not None:
+        combinations = random_combinations(args.random, seed=args.seed)
+    else:
+        combinations = grid_combinations()
+    results = sweep(data, combinations, processes=args.processes)
+
+    print(results.head(args.top).to_string())
+    if args.output:
+        results.to_csv(args.output, index=False)
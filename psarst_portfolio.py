@@ -0,0 +1,154 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+from PSARST import TRADE_DTYPE, print_metrics, trade_metrics
+from psarst_store import STORE_DIR, BarStore, indicator_block
+
+
+# Portfolio defaults
+CAPITAL = 100000
+MAX_POSITIONS = 20  # Open positions at any time
+MAX_POSITION_FRACTION = 0.1  # Largest position, as a fraction of equity
+
+# Trade ledger of the portfolio: the single-symbol ledger plus the symbol's column in the store
+PORTFOLIO_TRADE_DTYPE = np.dtype([('symbol', np.int32)] + TRADE_DTYPE.descr)
+
+
+def simulate_portfolio(close, low, atr, sar, supertrend, capital=CAPITAL, risk=0.01, target_atr=3,
+                       max_positions=MAX_POSITIONS, max_position_fraction=MAX_POSITION_FRACTION):
+    """
+    Run the PSAR + SuperTrend rules on many symbols with one cash balance.
+
+    Inputs are (bars x symbols) arrays on a shared calendar, NaN where a
+    symbol has no bar or an indicator is still warming up. Every bar is one
+    set of vector operations across all symbols:
+
+    - open positions update their trailing stop and exit at the stop or the
+      target, as in psarst_backtest;
+    - symbols with an entry signal are sized to risk a fraction risk of the
+      current equity between the entry and the previous bar's low, capped at
+      max_position_fraction of equity;
+    - candidates are ranked by breakout strength ((Close - previous
+      SuperTrend) / ATR) and admitted while their cumulative cost fits in
+      the cash and the free position slots.
+
+    Returns (equity, ledger): the mark-to-market account value per bar and a
+    PORTFOLIO_TRADE_DTYPE array (exit_index -1 for positions still open).
+    """
+    n_bars, n_symbols = close.shape
+    cash = float(capital)
+    shares = np.zeros(n_symbols)
+    entry_price = np.zeros(n_symbols)
+    entry_index = np.zeros(n_symbols, dtype=np.int64)
+    trailing_stop = np.zeros(n_symbols)
+    target_price = np.zeros(n_symbols)
+    holding = np.zeros(n_symbols, dtype=bool)
+    last_close = np.full(n_symbols, np.nan)  # Marks positions on bars a symbol does not trade
+    equity = np.empty(n_bars)
+    exits = []  # Closed trades, one array of rows per bar with exits
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Uptrend and entry trigger for every bar and symbol at once
+        uptrend = np.zeros((n_bars, n_symbols), dtype=bool)
+        uptrend[1:] = close[1:] > supertrend[:-1]
+        trigger = np.zeros((n_bars, n_symbols), dtype=bool)
+        trigger[1:] = uptrend[1:] & (sar[:-1] < close[1:]) & (close[1:] > low[:-1])
+        tradable = ~(np.isnan(close) | np.isnan(low) | np.isnan(atr) | np.isnan(sar) | np.isnan(supertrend))
+        strength = np.zeros((n_bars, n_symbols))
+        strength[1:] = (close[1:] - supertrend[:-1]) / atr[1:]
+
+        for t in range(n_bars):
+            price = close[t]
+            live = tradable[t]
+            last_close = np.where(np.isnan(price), last_close, price)
+
+            # Exits: trailing stop or target hit on the bar's close
+            active = holding & live
+            trailing_stop[active] = np.maximum(trailing_stop[active], price[active] - atr[t][active])
+            selling = active & ((price <= trailing_stop) | (price >= target_price))
+            if selling.any():
+                sold = np.flatnonzero(selling)
+                proceeds = shares[sold] * price[sold]
+                cash += proceeds.sum()
+                rows = np.empty(len(sold), dtype=PORTFOLIO_TRADE_DTYPE)
+                rows['symbol'], rows['entry_index'], rows['exit_index'] = sold, entry_index[sold], t
+                rows['entry_price'], rows['exit_price'], rows['shares'] = entry_price[sold], price[sold], shares[sold]
+                rows['pnl'] = proceeds - shares[sold] * entry_price[sold]
+                exits.append(rows)
+                holding[sold] = False
+                shares[sold] = 0.0
+
+            # Entries: rank today's signals and fill while cash and slots last (not on a symbol's exit bar)
+            value = cash + np.nansum(shares * last_close)
+            candidates = np.flatnonzero(trigger[t] & live & ~holding & ~selling)
+            free_slots = max_positions - int(np.count_nonzero(holding))
+            if len(candidates) and free_slots > 0 and cash > 0:
+                candidates = candidates[np.argsort(-strength[t][candidates], kind='stable')][:free_slots]
+                stop = low[t - 1][candidates]
+                wanted = np.minimum(risk * value / (price[candidates] - stop),
+                                    max_position_fraction * value / price[candidates])
+                cost = wanted * price[candidates]
+                bought = candidates[np.cumsum(cost) <= cash]
+                if len(bought):
+                    shares[bought] = wanted[:len(bought)]
+                    cash -= cost[:len(bought)].sum()
+                    holding[bought] = True
+                    entry_index[bought] = t
+                    entry_price[bought] = price[bought]
+                    trailing_stop[bought] = stop[:len(bought)]
+                    target_price[bought] = price[bought] + atr[t][bought] * target_atr
+
+            equity[t] = cash + np.nansum(shares * last_close)
+
+    still_open = np.flatnonzero(holding)
+    rows = np.zeros(len(still_open), dtype=PORTFOLIO_TRADE_DTYPE)
+    rows['symbol'], rows['entry_index'], rows['exit_index'] = still_open, entry_index[still_open], -1
+    rows['entry_price'], rows['shares'] = entry_price[still_open], shares[still_open]
+    rows['exit_price'] = rows['pnl'] = np.nan
+    ledger = np.concatenate(exits + [rows]) if exits else rows
+    return equity, ledger
+
+def portfolio_backtest(store, capital=CAPITAL, risk=0.01, target_atr=3, max_positions=MAX_POSITIONS,
+                       max_position_fraction=MAX_POSITION_FRACTION, **indicator_params):
+    """
+    Backtest the whole universe of a BarStore as one portfolio.
+
+    store is a BarStore or its path. Returns (equity, ledger, metrics):
+    equity is a Series over the store's dates, ledger a
+    PORTFOLIO_TRADE_DTYPE array and metrics the trade_metrics() dict of the
+    portfolio.
+    """
+    if not isinstance(store, BarStore):
+        store = BarStore(store)
+    block = indicator_block(store, slice(None), **indicator_params)
+    equity, ledger = simulate_portfolio(
+        store.field('Close'), store.field('Low'), block['ATR'], block['SAR'], block['SuperTrend'],
+        capital=capital, risk=risk, target_atr=target_atr, max_positions=max_positions,
+        max_position_fraction=max_position_fraction)
+    return pd.Series(equity, index=store.dates, name='Equity'), ledger, trade_metrics(ledger, equity, capital)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Backtest every symbol of a bar store as one portfolio.')
+    parser.add_argument('--store', default=STORE_DIR, help='Store directory (see psarst_store.py)')
+    parser.add_argument('--capital', type=float, default=CAPITAL, help='Starting cash')
+    parser.add_argument('--risk', type=float, default=0.01, help='Fraction of equity risked per trade')
+    parser.add_argument('--max-positions', type=int, default=MAX_POSITIONS, help='Open positions at any time')
+    parser.add_argument('--max-position-fraction', type=float, default=MAX_POSITION_FRACTION,
+                        help='Largest position as a fraction of equity')
+    parser.add_argument('--equity-output', help='Write the equity curve to this CSV file')
+    parser.add_argument('--trades-output', help='Write the trade ledger to this CSV file')
+    args = parser.parse_args()
+
+    store = BarStore(args.store)
+    equity, ledger, metrics = portfolio_backtest(store, capital=args.capital, risk=args.risk,
+                                                 max_positions=args.max_positions,
+                                                 max_position_fraction=args.max_position_fraction)
+    print_metrics(metrics)
+    print('Final Equity: ', equity.iloc[-1] if len(equity) else args.capital)
+    if args.equity_output:
+        equity.to_csv(args.equity_output)
+    if args.trades_output:
+        trades = pd.DataFrame(ledger)
+        trades.insert(1, 'ticker', [store.symbols[i] for i in ledger['symbol']])
+        trades.to_csv(args.trades_output, index=False)
@@ -0,0 +1,143 @@
+import functools
+import json
+import os
+import sys
+import time
+
+
+# Environment variables that switch instrumentation on, also for worker processes
+PROFILE_ENV = 'PSARST_PROFILE'  # JSON-lines output file, or "1" / "-" for stderr
+PROFILE_DIR_ENV = 'PSARST_PROFILE_DIR'  # Directory for one cProfile dump per stage call
+
+_enabled = False
+_output = None
+_profile_dir = None
+_stack = []  # Open stages, innermost last
+_dump_count = 0
+
+
+def configure(output='-', profile_dir=None):
+    """
+    Turn stage instrumentation on.
+
+    output is a file that receives one JSON line per stage call ("-" for
+    stderr). profile_dir, if given, receives a cProfile dump per stage call;
+    a stage's dump leaves out the stages nested in it, which get dumps of
+    their own. The settings are exported to the environment so worker processes
+    pick them up as well.
+    """
+    global _enabled, _output, _profile_dir
+    import tracemalloc
+
+    _enabled = True
+    _output = output
+    _profile_dir = profile_dir
+    os.environ[PROFILE_ENV] = output
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        os.environ[PROFILE_DIR_ENV] = profile_dir
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable():
+    global _enabled
+    import tracemalloc
+
+    _enabled = False
+    os.environ.pop(PROFILE_ENV, None)
+    os.environ.pop(PROFILE_DIR_ENV, None)
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+# Function to find how many rows a stage handled: the first frame/array in its result or arguments
+def _rows(args, result):
+    candidates = list(result) if isinstance(result, tuple) else [result]
+    for obj in candidates + list(args):
+        if hasattr(obj, 'shape') and len(obj.shape) > 0:
+            return int(obj.shape[0])
+    return None
+
+def _emit(record):
+    line = json.dumps(record)
+    if _output in ('-', '1'):
+        print(line, file=sys.stderr)
+    else:
+        with open(_output, 'a') as f:
+            f.write(line + '\n')
+
+def _run_instrumented(name, func, args, kwargs):
+    global _dump_count
+    import tracemalloc
+
+    # A nested stage resets the traced peak, so the enclosing stage keeps its own running maximum
+    start_bytes, peak_so_far = tracemalloc.get_traced_memory()
+    enclosing = _stack[-1] if _stack else None
+    if enclosing is not None:
+        enclosing['peak'] = max(enclosing['peak'], peak_so_far)
+
+    # Only one profiler can be active at a time: the enclosing stage's pauses while this one runs
+    profiler = None
+    if _profile_dir:
+        import cProfile
+        if enclosing is not None and enclosing['profiler'] is not None:
+            enclosing['profiler'].disable()
+        profiler = cProfile.Profile()
+
+    frame = {'peak': start_bytes, 'profiler': profiler}
+    _stack.append(frame)
+    tracemalloc.reset_peak()
+    if profiler is not None:
+        profiler.enable()
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        if profiler is not None:
+            profiler.disable()
+        _stack.pop()
+        frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        if enclosing is not None:
+            enclosing['peak'] = max(enclosing['peak'], frame['peak'])
+            if enclosing['profiler'] is not None:
+                enclosing['profiler'].enable()
+
+    record = {
+        'stage': name,
+        'wall_s': round(wall, 6),
+        'cpu_s': round(cpu, 6),
+        'mem_start_mb': round(start_bytes / 2 ** 20, 3),
+        'mem_peak_mb': round(frame['peak'] / 2 ** 20, 3),
+        'rows': _rows(args, result),
+        'depth': len(_stack),
+        'pid': os.getpid(),
+        'time': time.time(),
+    }
+    if profiler is not None:
+        _dump_count += 1
+        record['profile'] = os.path.join(_profile_dir, '{}-{}-{}.prof'.format(name, os.getpid(), _dump_count))
+        profiler.dump_stats(record['profile'])
+    _emit(record)
+    return result
+
+def stage(name):
+    """
+    Decorator marking a pipeline stage.
+
+    When instrumentation is off the wrapper only checks a flag and calls
+    through. When it is on, every call records wall time, CPU time, peak
+    traced memory and rows processed as one JSON line.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            return _run_instrumented(name, func, args, kwargs)
+        return wrapper
+    return decorator
+
+# Switch on from the environment, e.g. PSARST_PROFILE=stages.jsonl python PSARST.py
+if os.environ.get(PROFILE_ENV):
+    configure(os.environ[PROFILE_ENV], os.environ.get(PROFILE_DIR_ENV))
@@ -0,0 +1,340 @@
+import argparse
+import datetime as dt
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from PSARST import equity_curve, extract_data, sar_kernel, simulate_trades, trade_metrics, trend_flags
+from psarst_batch import SUMMARY_COLUMNS, print_row
+from psarst_cache import OHLCVCache
+
+
+# Fields stored per bar; 'Close' holds the adjusted close, as after indicators()
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+STORE_DIR = os.path.join('cache', 'bars')
+INDEX_FILE = 'index.json'
+DATES_FILE = 'dates.npy'
+
+# Store opened by each worker process
+_store = None
+
+
+class BarStore:
+    """
+    Columnar bar store for a universe of symbols.
+
+    A store is a directory with one float64 .npy file per field shaped
+    (dates x symbols), a dates.npy file and an index.json listing the
+    symbols. Fields are memory-mapped read-only: slicing returns views on
+    the file, and processes opening the same store share its pages.
+    Bars a symbol does not have (before listing, suspensions) are NaN.
+    """
+
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.symbols = json.load(f)['symbols']
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(path, DATES_FILE)), name='Date')
+        self._positions = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._fields = {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def field(self, name):
+        """Read-only (dates x symbols) memory map of one field."""
+        if name not in self._fields:
+            self._fields[name] = np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+        return self._fields[name]
+
+    def position(self, symbol):
+        return self._positions[symbol]
+
+    def column(self, name, symbol):
+        """One symbol's bars of a field, as a strided view on the file."""
+        return self.field(name)[:, self._positions[symbol]]
+
+    def frame(self, symbol):
+        """
+        One symbol's bars as a raw OHLCV frame like extract_data returns.
+
+        This copies the symbol's rows out of the store; use field() or
+        column() to work on the file directly.
+        """
+        columns = {name: self.column(name, symbol) for name in FIELDS}
+        valid = ~np.isnan(columns['Close'])
+        data = pd.DataFrame({name: np.array(values[valid]) for name, values in columns.items()},
+                            index=self.dates[valid])
+        data['Adj Close'] = data['Close']
+        return data
+
+    @classmethod
+    def create(cls, path, symbols, dates):
+        """
+        Lay out an empty (all NaN) store on disk and return the writable field maps.
+
+        An existing store at path is unlisted first by deleting its index, so
+        it cannot be opened with the old symbols while the fields are being
+        rewritten; write_index() lists the new one once it is filled.
+        """
+        os.makedirs(path, exist_ok=True)
+        try:
+            os.remove(os.path.join(path, INDEX_FILE))
+        except FileNotFoundError:
+            pass
+        np.save(os.path.join(path, DATES_FILE), np.asarray(dates, dtype='datetime64[ns]'))
+        fields = {}
+        for name in FIELDS:
+            fields[name] = np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+',
+                                                     dtype=np.float64, shape=(len(dates), len(symbols)))
+            fields[name][:] = np.nan
+        return fields
+
+# The index is written last, once the fields are filled, so an interrupted build leaves no openable store
+def write_index(path, symbols):
+    with open(os.path.join(path, INDEX_FILE), 'w') as f:
+        json.dump({'symbols': list(symbols), 'fields': FIELDS}, f)
+
+def build_store(path, tickers, start_date, end_date, cache=None):
+    """
+    Write the bars of tickers into a BarStore at path and open it.
+
+    Symbols are loaded one at a time through cache (an OHLCVCache in the
+    default location if not given), twice: once to collect the union of
+    their dates and once to fill the columns, so only one symbol's frame is
+    in memory at any time and the second pass reads from disk. Symbols
+    without data are left out.
+    """
+    if cache is None:
+        cache = OHLCVCache()
+    dates = pd.DatetimeIndex([])
+    symbols = []
+    for ticker in tickers:
+        data = extract_data(ticker, start_date, end_date, cache=cache)
+        if len(data) > 0:
+            dates = dates.union(data.index)
+            symbols.append(ticker)
+
+    fields = BarStore.create(path, symbols, dates)
+    for column, ticker in enumerate(symbols):
+        data = extract_data(ticker, start_date, end_date, cache=cache)
+        rows = dates.get_indexer(data.index)
+        if (rows < 0).any():
+            raise ValueError('Bars of {} changed while building the store at {}'.format(ticker, path))
+        for name in FIELDS:
+            source = 'Adj Close' if name == 'Close' else name
+            fields[name][rows, column] = data[source].to_numpy(dtype=np.float64)
+    for values in fields.values():
+        values.flush()
+    del fields
+    write_index(path, symbols)
+    return BarStore(path)
+
+# Function to smooth (bars x symbols) columns like pandas' ewm(alpha=1/length, min_periods=length).mean()
+def rma_block(values, length):
+    n_bars, n_symbols = values.shape
+    com = float(length) - 1.0  # alpha through a centre of mass, rounded as in psarst_stream.StreamingEWM
+    alpha = 1.0 / (1.0 + com)
+    old_wt_factor = 1.0 - alpha
+    result = np.empty((n_bars, n_symbols), dtype=np.float64)
+    if n_bars == 0:
+        return result
+
+    weighted = np.array(values[0], dtype=np.float64)
+    old_wt = np.ones(n_symbols)
+    nobs = (weighted == weighted).astype(np.int64)
+    result[0] = np.where(nobs >= length, weighted, np.nan)
+    for i in range(1, n_bars):
+        value = values[i]
+        is_observation = value == value
+        nobs += is_observation
+        started = weighted == weighted
+        old_wt[started] *= old_wt_factor
+        update = started & is_observation
+        change = update & (weighted != value)
+        weighted[change] = (old_wt[change] * weighted[change] + value[change]) / (old_wt[change] + 1.0)
+        old_wt[update] += 1.0
+        first = ~started & is_observation
+        weighted[first] = value[first]
+        result[i] = np.where(nobs >= length, weighted, np.nan)
+    return result
+
+def rsi_block(close, length=14):
+    """RSI of each column, matching ta.rsi(close, length)."""
+    negative = np.full(close.shape, np.nan)
+    negative[1:] = close[1:] - close[:-1]
+    positive = negative.copy()
+    positive[positive < 0] = 0
+    negative[negative > 0] = 0
+    positive_avg = rma_block(positive, length)
+    negative_avg = rma_block(negative, length)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 100 * positive_avg / (positive_avg + np.abs(negative_avg))
+
+def true_range_block(high, low, close):
+    """True range of each column, matching pandas_ta's true_range."""
+    high_low_range = high - low
+    # pandas_ta adds machine epsilon to a symbol's whole range when any bar of it is zero
+    high_low_range = high_low_range + np.where((high_low_range == 0).any(axis=0), sys.float_info.epsilon, 0.0)
+    prev_close = np.full(close.shape, np.nan)
+    prev_close[1:] = close[:-1]
+    ranges = np.stack([np.abs(high_low_range), np.abs(high - prev_close), np.abs(prev_close - low)])
+    with np.errstate(invalid='ignore'):
+        true_range = np.fmax(np.fmax(ranges[0], ranges[1]), ranges[2])
+    # The first bar of each symbol has no previous close
+    true_range[np.isnan(prev_close)] = np.nan
+    return true_range
+
+def atr_block(high, low, close, length=14):
+    """Average True Range of each column, matching ta.atr(high, low, close, length)."""
+    return rma_block(true_range_block(high, low, close), length)
+
+def supertrend_block(high, low, close, length=10, multiplier=3):
+    """SuperTrend line of each column, matching the first column of ta.supertrend."""
+    hl2 = 0.5 * (high + low)
+    matr = multiplier * atr_block(high, low, close, length)
+    upperband = hl2 + matr
+    lowerband = hl2 - matr
+    n_bars, n_symbols = close.shape
+    trend = np.empty((n_bars, n_symbols), dtype=np.float64)
+    if n_bars == 0:
+        return trend
+
+    trend[0] = 0.0
+    direction = np.ones(n_symbols, dtype=np.int8)
+    for i in range(1, n_bars):
+        up = close[i] > upperband[i - 1]
+        down = ~up & (close[i] < lowerband[i - 1])
+        hold = ~up & ~down
+        direction[up] = 1
+        direction[down] = -1
+        # Bands only tighten while the direction holds
+        lowerband[i] = np.where(hold & (direction > 0) & (lowerband[i] < lowerband[i - 1]),
+                                lowerband[i - 1], lowerband[i])
+        upperband[i] = np.where(hold & (direction < 0) & (upperband[i] > upperband[i - 1]),
+                                upperband[i - 1], upperband[i])
+        trend[i] = np.where(direction > 0, lowerband[i], upperband[i])
+    return trend
+
+# Function to group the columns of a (dates x symbols) validity mask by identical masks
+def row_groups(valid):
+    """Yield (rows, columns): the columns sharing one set of valid rows, and those rows."""
+    if valid.shape[1] == 0:
+        return
+    masks, inverse = np.unique(np.packbits(valid, axis=0).T, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    for group in range(len(masks)):
+        columns = np.flatnonzero(inverse == group)
+        yield np.flatnonzero(valid[:, columns[0]]), columns
+
+def indicator_block(store, columns, rsi_length=14, atr_length=14, st_length=10, st_multiplier=3,
+                    acceleration=0.02, max_acceleration=0.2):
+    """
+    Compute the indicators() columns for a slice of the store's symbols.
+
+    columns is a slice of symbol positions. Each symbol's indicators are
+    computed over its own bars only, as indicators() does on the symbol's
+    frame: dates it has no bar for (before listing, suspensions) neither
+    advance the averages nor step the SAR, and stay NaN. Symbols with the
+    same bar dates are computed together as one block. Results are shaped
+    (dates x symbols in the slice).
+    """
+    high, low, close = (store.field(name)[:, columns] for name in ['High', 'Low', 'Close'])
+    block = {name: np.full(close.shape, np.nan) for name in ['RSI', 'ATR', 'SuperTrend', 'SAR']}
+    for rows, group in row_groups(~np.isnan(close)):
+        if len(rows) == 0:
+            continue
+        cells = np.ix_(rows, group)
+        bars_high, bars_low, bars_close = high[cells], low[cells], close[cells]
+        block['RSI'][cells] = rsi_block(bars_close, rsi_length)
+        block['ATR'][cells] = atr_block(bars_high, bars_low, bars_close, atr_length)
+        block['SuperTrend'][cells] = supertrend_block(bars_high, bars_low, bars_close, st_length, st_multiplier)
+        block['SAR'][cells] = sar_kernel(bars_high, bars_low, acceleration=acceleration,
+                                         max_acceleration=max_acceleration)
+    return block
+
+def backtest_block(store, columns, capital=100000, risk=0.01, target_atr=3):
+    """Backtest the symbols in a slice of the store and return their summary rows."""
+    block = indicator_block(store, columns)
+    fields = {name: store.field(name)[:, columns] for name in FIELDS}
+    rows = []
+    for j, symbol in enumerate(store.symbols[columns]):
+        # Bars with any missing value are skipped, as indicators() drops them
+        values = [fields[name][:, j] for name in FIELDS] + [block[name][:, j] for name in block]
+        bars = np.flatnonzero(~np.isnan(np.stack(values)).any(axis=0))
+        close, low = fields['Close'][bars, j], fields['Low'][bars, j]
+        atr, supertrend, sar = block['ATR'][bars, j], block['SuperTrend'][bars, j], block['SAR'][bars, j]
+
+        row = {'ticker': symbol, 'start_date': store.dates[bars[0]] if len(bars) else None,
+               'end_date': store.dates[bars[-1]] if len(bars) else None, 'bars': len(bars), 'error': None}
+        signals, ledger = simulate_trades(close, low, atr, sar, trend_flags(close, supertrend),
+                                          risk * capital, target_atr)
+        row.update(trade_metrics(ledger, equity_curve(close, ledger, capital), capital))
+        rows.append(row)
+    return rows
+
+def _init_worker(path):
+    global _store
+    _store = BarStore(path)
+
+def _backtest_chunk(start, stop):
+    return backtest_block(_store, slice(start, stop))
+
+def backtest_store(path=STORE_DIR, processes=None, chunk_size=25, on_result=None):
+    """
+    Backtest every symbol of the store at path and return the summary table.
+
+    Symbols are processed in chunks of chunk_size columns across a process
+    pool. Workers open the store themselves, so no bar data is pickled and
+    all of them read the same mapped pages. on_result, if given, is called
+    with each row as it arrives.
+    """
+    n_symbols = len(BarStore(path).symbols)
+    chunks = [(start, min(start + chunk_size, n_symbols)) for start in range(0, n_symbols, chunk_size)]
+    processes = processes or os.cpu_count() or 1
+
+    rows = []
+    def collect(chunk_rows):
+        for row in chunk_rows:
+            if on_result is not None:
+                on_result(row)
+            rows.append(row)
+
+    if processes == 1:
+        _init_worker(path)
+        for start, stop in chunks:
+            collect(_backtest_chunk(start, stop))
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, max(len(chunks), 1)), initializer=_init_worker,
+                                 initargs=(path,)) as pool:
+            futures = [pool.submit(_backtest_chunk, start, stop) for start, stop in chunks]
+            for future in as_completed(futures):
+                collect(future.result())
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or backtest a memory-mapped multi-symbol bar store.')
+    parser.add_argument('--store', default=STORE_DIR, help='Store directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='Download symbols into the store')
+    build.add_argument('symbols', nargs='+', help='Symbols to store, e.g. TATASTEEL INFY')
+    build.add_argument('--years', type=int, default=10, help='Number of years of history')
+    build.add_argument('--suffix', default='.NS', help='Exchange suffix appended to each symbol')
+    backtest = commands.add_parser('backtest', help='Backtest every symbol in the store')
+    backtest.add_argument('--processes', type=int, default=None, help='Worker processes (default: CPU cores)')
+    backtest.add_argument('--output', help='Write the summary table to this CSV file')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        end_date = dt.datetime.now()
+        start_date = end_date - dt.timedelta(days=365 * args.years)
+        store = build_store(args.store, [symbol + args.suffix for symbol in args.symbols], start_date, end_date,
+                            cache=OHLCVCache())
+        print('Stored {} symbols x {} dates in {}'.format(len(store.symbols), len(store), args.store))
+    else:
+        summary = backtest_store(args.store, processes=args.processes, on_result=print_row)
+        if args.output:
+            summary.to_csv(args.output, index=False)
@@ -0,0 +1,267 @@
+import math
+import sys
+import numpy as np
+import pandas as pd
+
+from PSARST import NO_ACTION, BUY, HOLD, SELL
+
+
+NaN = float('nan')
+
+
+class StreamingEWM:
+    """
+    Exponentially weighted mean updated one value at a time.
+
+    Follows pandas' ewm(alpha=alpha, min_periods=min_periods).mean() step for
+    step (adjust=True, ignore_na=False), which is what pandas_ta's RMA uses.
+    NaN inputs are treated like missing observations, as pandas does.
+    """
+
+    def __init__(self, alpha, min_periods=0):
+        com = 1.0 / alpha - 1.0  # pandas converts alpha to a centre of mass and back
+        self.alpha = 1.0 / (1.0 + com)
+        self.old_wt_factor = 1.0 - self.alpha
+        self.min_periods = max(min_periods, 1)
+        self.weighted = NaN
+        self.old_wt = 1.0
+        self.nobs = 0
+        self.started = False
+
+    def update(self, value):
+        is_observation = value == value
+        self.nobs += is_observation
+        if not self.started:
+            self.weighted = value
+            self.started = True
+        elif self.weighted == self.weighted:
+            self.old_wt *= self.old_wt_factor
+            if is_observation:
+                if self.weighted != value:
+                    self.weighted = self.old_wt * self.weighted + value
+                    self.weighted /= (self.old_wt + 1.0)
+                self.old_wt += 1.0
+        elif is_observation:
+            self.weighted = value
+        return self.weighted if self.nobs >= self.min_periods else NaN
+
+class StreamingRSI:
+    """RSI with Wilder (RMA) smoothing, matching ta.rsi(close, length)."""
+
+    def __init__(self, length=14):
+        self.positive_avg = StreamingEWM(1.0 / length, min_periods=length)
+        self.negative_avg = StreamingEWM(1.0 / length, min_periods=length)
+        self.prev_close = NaN
+
+    def update(self, close):
+        change = close - self.prev_close
+        self.prev_close = close
+        positive = 0.0 if change < 0 else change  # NaN stays NaN, like the pandas masks
+        negative = 0.0 if change > 0 else change
+        positive_avg = self.positive_avg.update(positive)
+        negative_avg = self.negative_avg.update(negative)
+        denominator = positive_avg + abs(negative_avg)
+        if denominator == 0:  # Flat prices: 0 / 0, NaN as in pandas
+            return NaN
+        return 100 * positive_avg / denominator
+
+class StreamingATR:
+    """
+    Average True Range with RMA smoothing, matching ta.atr(high, low, close, length).
+
+    pandas_ta adds machine epsilon to the whole high-low range when any bar in
+    the history has a zero range; a stream cannot see the future, so values
+    can differ from the batch ones in the last bit in that case.
+    """
+
+    def __init__(self, length=14):
+        self.average = StreamingEWM(1.0 / length, min_periods=length)
+        self.prev_close = NaN
+        self.first_bar = True
+
+    def update(self, high, low, close):
+        prev_close = self.prev_close
+        self.prev_close = close
+        if self.first_bar:  # No previous close: the true range is undefined
+            self.first_bar = False
+            return self.average.update(NaN)
+
+        high_low_range = high - low
+        if high_low_range == 0:
+            high_low_range += sys.float_info.epsilon
+        # Largest of the three ranges, skipping missing ones like DataFrame.max
+        ranges = [r for r in (abs(high_low_range), abs(high - prev_close), abs(prev_close - low)) if r == r]
+        return self.average.update(max(ranges) if ranges else NaN)
+
+class StreamingSuperTrend:
+    """SuperTrend line matching the first column of ta.supertrend(high, low, close, length, multiplier)."""
+
+    def __init__(self, length=10, multiplier=3):
+        self.atr = StreamingATR(length)
+        self.multiplier = float(multiplier)
+        self.direction = 1
+        self.upperband = NaN
+        self.lowerband = NaN
+        self.bars = 0
+
+    def update(self, high, low, close):
+        hl2 = 0.5 * (high + low)
+        matr = self.multiplier * self.atr.update(high, low, close)
+        upperband = hl2 + matr
+        lowerband = hl2 - matr
+        self.bars += 1
+
+        if self.bars == 1:  # pandas_ta leaves the first bar at 0
+            self.upperband, self.lowerband = upperband, lowerband
+            return 0.0
+
+        if close > self.upperband:
+            self.direction = 1
+        elif close < self.lowerband:
+            self.direction = -1
+        else:
+            if self.direction > 0 and lowerband < self.lowerband:
+                lowerband = self.lowerband
+            if self.direction < 0 and upperband > self.upperband:
+                upperband = self.upperband
+
+        self.upperband, self.lowerband = upperband, lowerband
+        return lowerband if self.direction > 0 else upperband
+
+class StreamingSAR:
+    """Parabolic SAR updated one bar at a time, matching PSARST.calculate_sar."""
+
+    def __init__(self, acceleration=0.02, max_acceleration=0.2):
+        self.acceleration = acceleration
+        self.max_acceleration = max_acceleration
+        self.af = acceleration
+        self.ep = None
+        self.is_long = True
+        self.prev_sar = None
+
+    def update(self, high, low):
+        if self.prev_sar is None:  # First bar: start SAR and EP at the low
+            self.ep = self.prev_sar = low
+            return low
+
+        current_sar = self.prev_sar + self.af * (self.ep - self.prev_sar)
+        if self.is_long:
+            if current_sar > low:
+                self.is_long = False
+                current_sar = self.ep
+                self.af = self.acceleration
+                self.ep = high
+            elif high > self.ep:
+                self.ep = high
+                self.af = min(self.af + self.acceleration, self.max_acceleration)
+        else:
+            if current_sar < high:
+                self.is_long = True
+                current_sar = self.ep
+                self.af = self.acceleration
+                self.ep = low
+            elif low < self.ep:
+                self.ep = low
+                self.af = min(self.af + self.acceleration, self.max_acceleration)
+
+        self.prev_sar = current_sar
+        return current_sar
+
+class StreamingSignals:
+    """
+    Buy / Hold / Sell state machine of psarst_backtest, fed one indicator bar at a time.
+
+    Bars must already be complete (no missing values), as after indicators()
+    drops them. update() returns the signal code for the bar.
+    """
+
+    def __init__(self, capital=100000, risk=0.01, target_atr=3):
+        self.capital = capital
+        self.var = risk * capital
+        self.target_atr = target_atr
+        self.returns_per_trade = []
+        self.buy_position = 0
+        self.prev_low = None
+        self.prev_sar = None
+        self.prev_supertrend = None
+
+    def update(self, close, low, atr, supertrend, sar):
+        signal = NO_ACTION
+        if self.buy_position == 0:
+            # Uptrend: Close above the previous SuperTrend, and SAR of the previous bar below Close.
+            # A close exactly at the previous low leaves no room for the stop loss, so no entry
+            if (self.prev_supertrend is not None and close > self.prev_supertrend and self.prev_sar < close
+                    and close != self.prev_low):
+                signal = BUY
+                self.buy_position = 1
+                self.buy_price = close
+                self.trailing_stop_loss = self.prev_low
+                self.target_price = close + (atr * self.target_atr)
+                self.num_of_shares = self.var / (close - self.prev_low)
+                self.capital_traded = self.num_of_shares * close
+        else:
+            self.trailing_stop_loss = max(self.trailing_stop_loss, close - atr)
+            if close <= self.trailing_stop_loss or close >= self.target_price:
+                signal = SELL
+                self.buy_position = 0
+                self.returns_per_trade.append(close * self.num_of_shares - self.capital_traded)
+            else:
+                signal = HOLD
+
+        self.prev_low, self.prev_sar, self.prev_supertrend = low, sar, supertrend
+        return signal
+
+class StreamingStrategy:
+    """
+    Incremental version of indicators() -> trend_detection() -> psarst_backtest().
+
+    Feed raw bars with update(); each call is O(1) and returns a dict with the
+    RSI, ATR, SuperTrend, SAR and Signal of that bar. Bars where any indicator
+    is still warming up are reported with Signal None and skipped by the signal
+    generator, just as indicators() drops them.
+    """
+
+    def __init__(self, rsi_length=14, atr_length=14, st_length=10, st_multiplier=3,
+                 acceleration=0.02, max_acceleration=0.2, capital=100000, risk=0.01, target_atr=3):
+        self.rsi = StreamingRSI(rsi_length)
+        self.atr = StreamingATR(atr_length)
+        self.supertrend = StreamingSuperTrend(st_length, st_multiplier)
+        self.sar = StreamingSAR(acceleration, max_acceleration)
+        self.signals = StreamingSignals(capital, risk, target_atr)
+
+    def update(self, open_, high, low, close, volume):
+        """Add one bar; close is the adjusted close used throughout the strategy."""
+        bar = {
+            'RSI': self.rsi.update(close),
+            'ATR': self.atr.update(high, low, close),
+            'SuperTrend': self.supertrend.update(high, low, close),
+            'SAR': self.sar.update(high, low),
+        }
+        values = [open_, high, low, close, volume] + list(bar.values())
+        if any(math.isnan(value) for value in values):
+            bar['Signal'] = None
+        else:
+            bar['Signal'] = self.signals.update(close, low, bar['ATR'], bar['SuperTrend'], bar['SAR'])
+        return bar
+
+def replay(data, **params):
+    """
+    Feed a raw OHLCV frame through StreamingStrategy bar by bar.
+
+    Returns the complete bars with the same columns as indicators() plus the
+    int8 'Signal' codes, for comparison with the batch pipeline.
+    """
+    strategy = StreamingStrategy(**params)
+    rows, index = [], []
+    columns = zip(data.index, data['Open'].tolist(), data['High'].tolist(), data['Low'].tolist(),
+                  data['Adj Close'].tolist(), data['Volume'].tolist())
+    for date, open_, high, low, close, volume in columns:
+        bar = strategy.update(open_, high, low, close, volume)
+        if bar['Signal'] is not None:
+            rows.append([open_, high, low, close, volume, bar['RSI'], bar['ATR'], bar['SuperTrend'],
+                         bar['SAR'], bar['Signal']])
+            index.append(date)
+    frame = pd.DataFrame(rows, index=pd.Index(index, name=data.index.name),
+                         columns=['Open', 'High', 'Low', 'Close', 'Volume', 'RSI', 'ATR', 'SuperTrend', 'SAR', 'Signal'])
+    frame['Signal'] = frame['Signal'].astype(np.int8)
+    return frame
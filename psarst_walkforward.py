@@ -0,0 +1,108 @@
+import argparse
+import datetime as dt
+import numpy as np
+import pandas as pd
+
+from PSARST import TRADING_DAYS, equity_curve, extract_data, indicators, simulate_trades, trade_metrics, trend_flags
+from psarst_batch import map_chunks
+from psarst_cache import OHLCVCache
+
+
+# Columns of the per-window table, in display order
+WINDOW_COLUMNS = ['window', 'start_date', 'end_date', 'bars', 'number_of_trades', 'total_return', 'return_percent',
+                  'sharpe_ratio', 'win_rate', 'max_drawdown', 'exposure']
+
+
+# Windows are laid out backwards from the last bar, so the most recent bars are always covered
+def rolling_windows(n_bars, window, step):
+    """(start, stop) bar positions of fixed-length windows moved forward by step bars."""
+    return [(start, start + window) for start in reversed(range(n_bars - window, -1, -step))]
+
+def expanding_windows(n_bars, min_window, step):
+    """(start, stop) bar positions of windows that all start at the first bar and grow by step bars."""
+    return [(0, stop) for stop in reversed(range(n_bars, min_window - 1, -step))]
+
+def prepare_columns(data, **indicator_params):
+    """
+    Run indicators() once over the whole history and return the arrays the simulation needs.
+
+    Every window is then a slice of these arrays, so indicators are never
+    recomputed and each window starts with fully warmed-up values.
+    """
+    data = indicators(data, **indicator_params)
+    close = data['Close'].to_numpy(dtype=np.float64)
+    return {
+        'Date': data.index.to_numpy(),
+        'Close': close,
+        'Low': data['Low'].to_numpy(dtype=np.float64),
+        'ATR': data['ATR'].to_numpy(dtype=np.float64),
+        'SAR': data['SAR'].to_numpy(dtype=np.float64),
+        'Uptrend': trend_flags(close, data['SuperTrend'].to_numpy(dtype=np.float64)),
+    }
+
+def evaluate_window(columns, start, stop, capital=100000, risk=0.01, target_atr=3):
+    """
+    Backtest bars [start, stop) of the precomputed columns.
+
+    The simulation starts flat on the window's first bar; the trend on that bar
+    still uses the previous bar's SuperTrend.
+    """
+    close = columns['Close'][start:stop]
+    signals, ledger = simulate_trades(close, columns['Low'][start:stop], columns['ATR'][start:stop],
+                                      columns['SAR'][start:stop], columns['Uptrend'][start:stop], risk * capital,
+                                      target_atr)
+    return trade_metrics(ledger, equity_curve(close, ledger, capital), capital)
+
+def _evaluate_chunk(columns, chunk, capital, risk, target_atr):
+    rows = []
+    for window, start, stop in chunk:
+        row = {'window': window, 'start_date': columns['Date'][start], 'end_date': columns['Date'][stop - 1],
+               'bars': stop - start}
+        row.update(evaluate_window(columns, start, stop, capital, risk, target_atr))
+        rows.append(row)
+    return rows
+
+def walk_forward(data, window=TRADING_DAYS, step=21, expanding=False, processes=None, capital=100000,
+                 risk=0.01, target_atr=3, chunk_size=50, **indicator_params):
+    """
+    Evaluate the strategy on many rolling (or expanding) windows of one symbol.
+
+    data is a raw OHLCV frame as returned by extract_data. window and step
+    are in bars; with expanding=True every window starts at the first bar and
+    window is the shortest one. Indicators are computed once, then the
+    windows are simulated in chunks across a process pool. Returns one row
+    of metrics per window, in window order.
+    """
+    columns = prepare_columns(data, **indicator_params)
+    n_bars = len(columns['Close'])
+    bounds = expanding_windows(n_bars, window, step) if expanding else rolling_windows(n_bars, window, step)
+    windows = [(i, start, stop) for i, (start, stop) in enumerate(bounds)]
+    rows = map_chunks(_evaluate_chunk, windows, columns, args=(capital, risk, target_atr), processes=processes,
+                      chunk_size=chunk_size)
+
+    results = pd.DataFrame(rows, columns=WINDOW_COLUMNS)
+    return results.sort_values('window', ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Walk-forward evaluation of PSARST on one symbol.')
+    parser.add_argument('symbol', help='Symbol to evaluate, e.g. TATASTEEL')
+    parser.add_argument('--years', type=int, default=10, help='Number of years of history')
+    parser.add_argument('--suffix', default='.NS', help='Exchange suffix appended to the symbol')
+    parser.add_argument('--window', type=int, default=TRADING_DAYS, help='Window length in bars '
+                                                                                  '(shortest window with --expanding)')
+    parser.add_argument('--step', type=int, default=21, help='Bars between consecutive windows')
+    parser.add_argument('--expanding', action='store_true', help='Grow windows from the first bar instead of rolling')
+    parser.add_argument('--processes', type=int, default=None, help='Worker processes (default: CPU cores)')
+    parser.add_argument('--output', help='Write the per-window table to this CSV file')
+    args = parser.parse_args()
+
+    end_date = dt.datetime.now()
+    start_date = end_date - dt.timedelta(days=365 * args.years)
+    data = extract_data(args.symbol + args.suffix, start_date, end_date, cache=OHLCVCache())
+    results = walk_forward(data, window=args.window, step=args.step, expanding=args.expanding,
+                           processes=args.processes)
+
+    print(results.to_string())
+    print(results[['return_percent', 'sharpe_ratio', 'win_rate', 'max_drawdown']].describe().to_string())
+    if args.output:
+        results.to_csv(args.output, index=False)
@@ -0,0 +1,109 @@
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import os
+import secrets
+import sys
+from multiprocessing.connection import Listener
+
+from psarst_client import STATE_FILE, connect, start_worker, stop_worker, submit
+
+
+def _warm_imports():
+    # Import everything the pipeline loads lazily, so the first job does not pay for it
+    import PSARST  # noqa: F401
+    import matplotlib.pyplot  # noqa: F401
+    import mplfinance.original_flavor  # noqa: F401
+    import pandas_ta  # noqa: F401
+    import yfinance  # noqa: F401
+
+def run_job(job, cache, results):
+    """Run one {'symbol', 'years', ...} job through run_pipeline and return the reply for the client."""
+    from PSARST import run_pipeline
+
+    output = io.StringIO()
+    try:
+        # A malformed job becomes an error reply; it must not end the worker
+        end_date = dt.datetime.now()
+        start_date = end_date - dt.timedelta(days=365 * int(job['years']))
+        ticker = job['symbol'] + job.get('suffix', '.NS')
+        with contextlib.redirect_stdout(output):
+            run_pipeline(ticker, start_date, end_date, cache=cache, plot=job.get('plot', True),
+                         plot_path=job.get('plot_file'), results=results)
+    except Exception as e:
+        return {'ok': False, 'output': output.getvalue(), 'error': '{}: {}'.format(type(e).__name__, e)}
+    return {'ok': True, 'output': output.getvalue()}
+
+def _write_state(state_file, address, authkey):
+    # Readable by the owner only: the key lets anyone run jobs in this process
+    fd = os.open(state_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'pid': os.getpid(), 'address': list(address), 'authkey': authkey.hex()}, f)
+
+def serve(state_file=STATE_FILE):
+    """
+    Keep a warm interpreter and run jobs sent by clients, one at a time.
+
+    Listens on a random localhost port; the address and a fresh random
+    authkey are written to state_file. Downloaded bars and backtest results
+    stay cached in memory between jobs. A {'command': 'shutdown'} message
+    stops the worker.
+    """
+    from psarst_cache import OHLCVCache
+    from psarst_memo import ResultCache
+
+    _warm_imports()
+    cache, results = OHLCVCache(), ResultCache()
+    authkey = secrets.token_bytes(32)
+    with Listener(('127.0.0.1', 0), authkey=authkey) as listener:
+        _write_state(state_file, listener.address, authkey)
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError):  # Failed handshake, e.g. a wrong authkey
+                    continue
+                with connection:
+                    while True:
+                        try:
+                            job = connection.recv()
+                        except (EOFError, OSError):
+                            break
+                        if isinstance(job, dict) and job.get('command') == 'shutdown':
+                            with contextlib.suppress(FileNotFoundError):
+                                os.remove(state_file)  # Before replying, so the client sees the worker gone
+                            connection.send({'ok': True, 'output': ''})
+                            return
+                        connection.send(run_job(job, cache, results))
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(state_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Warm PSARST worker that keeps the heavy libraries imported.')
+    parser.add_argument('command', choices=['serve', 'run', 'stop'], help='Start a worker, send it a job, or stop it')
+    parser.add_argument('--state-file', default=STATE_FILE, help='Address and key of the running worker')
+    parser.add_argument('--symbol', help='Symbol for run (required), e.g. TATASTEEL')
+    parser.add_argument('--years', type=int, default=10, help='Number of years of history for run')
+    parser.add_argument('--suffix', default='.NS', help='Exchange suffix appended to the symbol')
+    parser.add_argument('--no-plot', action='store_true', help='Skip the chart')
+    parser.add_argument('--plot-file', help='Save the chart to this file instead of showing it')
+    args = parser.parse_args()
+    if args.command == 'run' and not args.symbol:
+        parser.error('run requires --symbol')
+
+    if args.command == 'serve':
+        serve(args.state_file)
+    elif args.command == 'stop':
+        print('Worker stopped.' if stop_worker(args.state_file) else 'No worker is running.')
+    else:
+        connection = connect(args.state_file) or start_worker(state_file=args.state_file)
+        with connection:
+            reply = submit(connection, args.symbol, args.years, args.suffix, plot=not args.no_plot,
+                           plot_file=args.plot_file)
+        print(reply['output'], end='')
+        if not reply['ok']:
+            print(reply['error'], file=sys.stderr)
+            sys.exit(1)
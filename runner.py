@@ -1,14 +1,21 @@
 import os
 import subprocess
-subprocess.run("python -m pip install colorama", check=True, shell=True)
 from pathlib import Path
 import sys
 import shutil
 import datetime
 import re
 import logging
+import hashlib
+import importlib.metadata
+import json
 import urllib.request
-from colorama import init, Fore, Style
+import argparse
+try:
+    from colorama import init, Fore, Style
+except ImportError:  # Install it once, for the interpreter running this script
+    subprocess.run([sys.executable, "-m", "pip", "install", "colorama"], check=True)
+    from colorama import init, Fore, Style
 
 # Initialize colorama
 init()
@@ -72,8 +79,47 @@ def check_python_version(venv_path):
     return False
 
 # Dependencies Check
-def dependencies_installed(venv_path):
+DEPS_FINGERPRINT_FILE = ".psarst_deps_ok"  # Stored inside the virtual environment
+
+# Function to normalise a distribution name the way pip does (PEP 503)
+def normalize_name(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+def site_packages_dirs(venv_path):
+    if os.name == "nt":
+        return [path for path in [venv_path / "Lib" / "site-packages"] if path.exists()]
+    return sorted(venv_path.glob("lib/python*/site-packages"))
+
+# Fingerprint of everything the validation result depends on
+def dependency_fingerprint(venv_path):
+    python_path = venv_path / ("Scripts/python.exe" if os.name == "nt" else "bin/python")
+    digest = hashlib.sha256()
+    digest.update(requirements_path.read_bytes())
+    digest.update(str(python_path.resolve()).encode())
+    # Installing or removing packages changes the site-packages directory listing and so its mtime
+    for path in [python_path] + site_packages_dirs(venv_path):
+        stat = path.stat()
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+# Installed distributions of the virtual environment as {normalised name: version}
+def installed_versions(venv_path):
+    dirs = site_packages_dirs(venv_path)
+    if dirs:
+        # Read the package metadata in-process, without starting the venv interpreter
+        return {normalize_name(dist.metadata["Name"]): dist.version
+                for dist in importlib.metadata.distributions(path=[str(d) for d in dirs])
+                if dist.metadata["Name"]}
+
+    # Unusual layout: ask pip once for everything
     pip_path = venv_path / "Scripts" / "pip" if os.name == "nt" else venv_path / "bin" / "pip"
+    result = subprocess.run([pip_path, "list", "--format=json"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        return {}
+    return {normalize_name(package["name"]): package["version"] for package in json.loads(result.stdout)}
+
+def dependencies_installed(venv_path):
+    fingerprint_path = venv_path / DEPS_FINGERPRINT_FILE
 
     # Function to clean up version string to avoid issues with non-numeric characters
     def clean_version(version_str):
@@ -84,31 +130,28 @@ def dependencies_installed(venv_path):
         if not requirements_path.exists():
             raise FileNotFoundError(f"Requirements file '{requirements_path}' not found.")
 
+        # Unchanged requirements and environment since the last successful check: nothing to do
+        fingerprint = dependency_fingerprint(venv_path)
+        if fingerprint_path.exists() and fingerprint_path.read_text().strip() == fingerprint:
+            print(f"[{GREEN} OK {RESET}] Dependencies unchanged since last validation.")
+            logging.info("Dependencies unchanged since last validation.")
+            return True
+
         # Open the requirements file
         with open(requirements_path, "r") as f:
             requirements = f.readlines()
 
+        installed = installed_versions(venv_path)
         for req in requirements:
             req = req.strip()
             if req:  # Skip empty lines
                 # Check if the package is already installed
-                result = subprocess.run(
-                    [pip_path, "show", req.split("==")[0]],  # Only check the package name
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                )
-                if result.returncode != 0:  # If package not found
+                installed_version = installed.get(normalize_name(req.split("==")[0]))
+                if installed_version is None:  # If package not found
                     print(f"[{RED} MISSING {RESET}] {req} is not installed.")
                     logging.error(f"{req} is not installed.")
                     return False
                 else:
-                    # Get the installed version from the 'pip show' output
-                    installed_version = subprocess.run(
-                        [pip_path, "show", req.split("==")[0]],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                    )
-                    installed_version = installed_version.stdout.decode().strip().split('\n')[1].split(': ')[1]
                     installed_version = clean_version(installed_version)  # Clean the version string
 
                     # Compare with required version if specified
@@ -126,6 +169,8 @@ def dependencies_installed(venv_path):
                     else:
                         print(f"[{GREEN} OK {RESET}] {req} is already installed (latest version).")
                         logging.info(f"{req} is already installed (latest version).")
+
+        fingerprint_path.write_text(fingerprint)
         return True
 
     except FileNotFoundError as e:
@@ -156,6 +201,43 @@ def run_main_script(venv_path):
     logging.info(f"Running {SCRIPT_PATH}...")
     run_command(f"{python_path} {SCRIPT_PATH}")
 
+# Warm mode: keep one interpreter with the libraries imported and send it successive jobs
+def run_warm(venv_path):
+    import psarst_client
+
+    python_path = venv_path / "Scripts" / "python" if os.name == "nt" else venv_path / "bin" / "python"
+    state_file = venv_path / psarst_client.STATE_FILE
+    connection = psarst_client.connect(state_file)
+    if connection is None:
+        print(f"[{GREEN} -- {RESET}] Starting the PSARST worker...")
+        logging.info("Starting the PSARST worker...")
+        try:
+            connection = psarst_client.start_worker(python_path, state_file, log_file=venv_path / "psarst_worker.log")
+        except (RuntimeError, TimeoutError) as e:
+            print(f"[{RED} FAILED {RESET}] {e}")
+            logging.error(e)
+            sys.exit(1)
+    else:
+        print(f"[{GREEN} OK {RESET}] Connected to the running PSARST worker.")
+        logging.info("Connected to the running PSARST worker.")
+
+    # Ask for jobs until an empty symbol is entered
+    with connection:
+        while True:
+            symbol = input("Enter Symbol (empty to quit): ").strip()
+            if not symbol:
+                break
+            try:
+                years = int(input("Enter Number of Years: "))
+            except ValueError:
+                print(f"[{RED} FAILED {RESET}] The number of years must be a whole number.")
+                continue
+            reply = psarst_client.submit(connection, symbol, years)
+            print(reply["output"], end="")
+            if not reply["ok"]:
+                print(f"[{RED} FAILED {RESET}] {reply['error']}")
+                logging.error(reply["error"])
+
 # Python Version Installer (placeholder for simplicity)
 def check_or_install_python():
     local_python_path = Path(LOCAL_PYTHON_DIR) / f"python-{PYTHON_VERSION}"
@@ -198,9 +280,21 @@ def check_or_install_python():
 
 # Main Function
 def main():
+    parser = argparse.ArgumentParser(description="Set up the PSARST environment and run the backtest.")
+    parser.add_argument("--warm", action="store_true",
+                        help="Keep a background worker with the libraries loaded and run several symbols in a row")
+    parser.add_argument("--stop-worker", action="store_true", help="Stop the background worker and exit")
+    args = parser.parse_args()
+
     setup_logging()
     venv_path = Path(VENV_NAME)
 
+    if args.stop_worker:
+        import psarst_client
+        stopped = psarst_client.stop_worker(venv_path / psarst_client.STATE_FILE)
+        print(f"[{GREEN} OK {RESET}] " + ("PSARST worker stopped." if stopped else "No PSARST worker is running."))
+        return
+
     # Ensure the requirements file exists
     if not requirements_path.exists():
         print(f"[{RED}FAILED{RESET}] Requirements file '{REQUIREMENTS_FILE}' not found.")
@@ -242,8 +336,11 @@ def main():
             logging.warning("Dependencies are missing or outdated. Installing...")
             install_requirements(venv_path)
 
-    # Run the main script
-    run_main_script(venv_path)
+    # Run the main script, or hand the job to a warm worker
+    if args.warm:
+        run_warm(venv_path)
+    else:
+        run_main_script(venv_path)
 
 if __name__ == "__main__":
     main()